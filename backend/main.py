@@ -1,7 +1,7 @@
 import config
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import upload, generate, health, audio_to_text, simple_ppt, question_handler, notice
+from routes import upload, generate, health, audio_to_text, simple_ppt, question_handler, notice, slides
 from services import asr
 from services import cloudfare_audio_to_text
 
@@ -23,6 +23,7 @@ app.include_router(audio_to_text.router, prefix="/dev", tags=["Dev"])
 app.include_router(simple_ppt.router, prefix="/simple", tags=["Simple"])
 app.include_router(question_handler.router, prefix="/questions", tags=["Questions"])
 app.include_router(notice.router, prefix="/notice", tags=["Notice"])
+app.include_router(slides.router, prefix="/slides", tags=["Slides"])
 
 @app.get("/")
 def read_root():
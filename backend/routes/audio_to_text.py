@@ -1,36 +1,41 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from services.asr import ASRService
-from utils.gcp import GCSClient
+from utils.gcp import get_gcs
 from utils.audio_preprocess import to_linear16_wav_file
-import uuid, os, soundfile as sf
+import uuid, os
 
 router = APIRouter()
 asr = ASRService()
-gcs = GCSClient()
 
 # hard code path
 LOCAL_AUDIO_PATH = "/Users/hanyunguo/Downloads/New Folder With Items/University of Waterloo.mp3"
 
 @router.post("/local-audio-to-text")
-def hardcoded_audio_to_text(lang: str = "en-US"):
+def hardcoded_audio_to_text(lang: str = "en-US", chunked: bool = False):
 # def hardcoded_audio_to_text(lang: str = "cmn-Hans-CN"):
     try:
         if not os.path.exists(LOCAL_AUDIO_PATH):
             raise HTTPException(status_code=400, detail=f"File not found: {LOCAL_AUDIO_PATH}")
 
+        if chunked:
+            # 长录音：按静音切段并行识别，不上传 GCS，也不等 long-running operation
+            result = asr.transcribe_chunked(LOCAL_AUDIO_PATH, language_code=lang, sample_rate=16000)
+            return JSONResponse(content={"ok": True, **result})
+
         # 统一成单声道·16k PCM16
         wav_path = to_linear16_wav_file(LOCAL_AUDIO_PATH, target_sr=16000)
 
+        import soundfile as sf
         with sf.SoundFile(wav_path) as f:
             ch, rate = f.channels, f.samplerate
         if ch != 1 or rate != 16000:
             raise HTTPException(status_code=500, detail=f"Convert failed: channels={ch}, sample_rate={rate}")
 
         blob = f"voice/dev/{uuid.uuid4().hex}.wav"
-        gcs.upload_file(wav_path, blob)
+        get_gcs().upload_file(wav_path, blob)
         gs_uri = f"gs://{os.getenv('GCS_BUCKET')}/{blob}"
-        url = gcs.generate_signed_url(blob, expiration=3600)
+        url = get_gcs().generate_signed_url(blob, expiration=3600)
 
         text = asr.transcribe_gcs(gs_uri, language_code=lang, sample_rate=16000)
 
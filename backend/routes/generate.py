@@ -4,42 +4,50 @@ from services.avatar_generation import generate_avatar
 from services.generate_speech import generate_speech
 from services.ppt_processor import PPTProcessor
 from services.file_to_speech import PPTProcessor as FileToSpeechProcessor
-from utils.gcp import GCSClient
-from utils.Topview import gen_video_batch
+from utils.gcp import get_gcs
+from utils.Topview import gen_video_batch, invalidate_voice_clone
+from services.jobs import presentation_jobs
+from services.deck_store import deck_store
+import asyncio
+import json
 import tempfile
 import os
-from fastapi import Body
+from fastapi import Body, BackgroundTasks
+from fastapi.responses import StreamingResponse
 
 router = APIRouter()
 ppt_processor = PPTProcessor()
 file_to_speech_processor = FileToSpeechProcessor()
-gcs = GCSClient()
 
-@router.post("/presentation")
-async def generate_presentation(
-    ppt_blob: str = Body(...),
-    face_blob: str = Body(...),
-    voice_blob: str = Body(None),
-    voice_id: str = Body(None),
-    voice_choice: str = Body("upload"),
-    style: str = Body("professional")
-):
+JOB_STAGES = ["download", "slides", "voice_clone", "face_upload", "videos"]
+JOB_EVENTS_POLL_INTERVAL = 0.5
+
+def _check_voice_config(voice_blob, voice_id, voice_choice):
+    if voice_choice == "upload" and voice_blob:
+        return
+    if voice_choice == "existing" and voice_id:
+        return
+    raise HTTPException(status_code=400, detail="Invalid voice configuration")
+
+def _build_presentation(ppt_blob, face_blob, voice_blob, voice_id, voice_choice, style,
+                        on_stage=None, on_slides=None, on_video=None):
     """
-    Generate a complete presentation with slides and avatar videos (DEMO MODE)
+    Run the full generation pipeline (blocking).
+
+    on_stage(stage, "start" | "done"), on_slides(slides_data, scripts) and
+    on_video(index, path) are optional progress hooks for the job API.
     """
-    print(f"DEMO MODE: Processing files: ppt={ppt_blob}, face={face_blob}, voice_choice={voice_choice}, style={style}")
-    
-    try:
-        # DEMO MODE: Simulate 6-second generation delay
-        print("DEMO MODE: Simulating generation process...")
-        import asyncio
-        await asyncio.sleep(6)
-        
-        # Create temporary files for downloaded content
-        ppt_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-        face_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    on_stage = on_stage or (lambda stage, status: None)
+    gcs = get_gcs()
 
+    # Create temporary files for downloaded content
+    ppt_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
+    face_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    voice_path = None
+
+    try:
         # Download files from GCS
+        on_stage("download", "start")
         gcs.download_file(ppt_blob, ppt_temp.name)
         gcs.download_file(face_blob, face_temp.name)
 
@@ -53,9 +61,11 @@ async def generate_presentation(
             voice_path = voice_id
         else:
             raise HTTPException(status_code=400, detail="Invalid voice configuration")
+        on_stage("download", "done")
 
         # DEMO MODE: Process PPT to get actual slide images and content
         print("DEMO MODE: Processing PPT to extract slide images...")
+        on_stage("slides", "start")
         ppt_result = ppt_processor.process_presentation(ppt_temp.name, style)
         slides_data = ppt_result['slides']
         scripts = ppt_result['scripts']
@@ -81,13 +91,24 @@ async def generate_presentation(
                 })
 
         print(f"DEMO MODE: Processed {len(slides_data)} slides with {'real' if ppt_result['slides'] else 'mock'} content")
+        if ppt_result['slides']:
+            # Parsed deck for the live Q&A path, stored next to the blob
+            try:
+                deck_store.load(gcs, ppt_blob, local_path=ppt_temp.name)
+            except Exception as e:
+                print(f"Failed to save deck artifact for {ppt_blob}: {e}")
+        on_stage("slides", "done")
+        if on_slides:
+            on_slides(slides_data, scripts)
 
         # DEMO MODE: Generate video URLs using gen_video_batch (which now returns hardcoded paths and IDs)
         print("DEMO MODE: Calling gen_video_batch to get video URLs and IDs...")
         gen_result = gen_video_batch(
             audio_path=voice_path,
             video_path=face_temp.name,
-            tts_text=scripts
+            tts_text=scripts,
+            on_stage=on_stage,
+            on_video=on_video
         )
         video_urls = gen_result["video_urls"]
         voice_id = gen_result["voice_id"]
@@ -96,31 +117,201 @@ async def generate_presentation(
         print(f"DEMO MODE: Received voice_id: {voice_id}")
         print(f"DEMO MODE: Received video_file_id: {video_file_id}")
 
+        return {
+            "slides": slides_data,
+            "scripts": scripts,
+            "video_urls": video_urls,
+            "voice_id": voice_id,
+            "video_file_id": video_file_id
+        }
+    finally:
         # Clean up temporary files
         try:
             os.unlink(ppt_temp.name)
             os.unlink(face_temp.name)
-            if voice_choice == "upload" and voice_blob:
+            if voice_choice == "upload" and voice_blob and voice_path:
                 os.unlink(voice_path)
         except:
             pass
 
+@router.post("/presentation")
+async def generate_presentation(
+    ppt_blob: str = Body(...),
+    face_blob: str = Body(...),
+    voice_blob: str = Body(None),
+    voice_id: str = Body(None),
+    voice_choice: str = Body("upload"),
+    style: str = Body("professional")
+):
+    """
+    Generate a complete presentation with slides and avatar videos (DEMO MODE)
+
+    Blocks until the whole pipeline is done; prefer POST /presentation/jobs
+    for real decks.
+    """
+    print(f"DEMO MODE: Processing files: ppt={ppt_blob}, face={face_blob}, voice_choice={voice_choice}, style={style}")
+    
+    try:
+        # DEMO MODE: Simulate 6-second generation delay
+        print("DEMO MODE: Simulating generation process...")
+        await asyncio.sleep(6)
+
+        _check_voice_config(voice_blob, voice_id, voice_choice)
+        presentation = await asyncio.to_thread(
+            _build_presentation, ppt_blob, face_blob, voice_blob, voice_id, voice_choice, style
+        )
+
         return {
             "success": True,
-            "presentation": {
-                "slides": slides_data,
-                "scripts": scripts,
-                "video_urls": video_urls,
-                "voice_id": voice_id,
-                "video_file_id": video_file_id
-            }
+            "presentation": presentation
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in presentation generation: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to generate presentation: {str(e)}")
 
+def _run_presentation_job(job_id, ppt_blob, face_blob, voice_blob, voice_id, voice_choice, style):
+    def on_stage(stage, status):
+        if status == "start":
+            presentation_jobs.start_stage(job_id, stage)
+        else:
+            presentation_jobs.finish_stage(job_id, stage)
+
+    def on_slides(slides_data, scripts):
+        presentation_jobs.update_result(job_id, slides=slides_data, scripts=scripts)
+        presentation_jobs.init_slides(job_id, len(scripts))
+
+    def on_video(index, path):
+        presentation_jobs.set_slide_video(job_id, index, path)
+
+    try:
+        presentation = _build_presentation(
+            ppt_blob, face_blob, voice_blob, voice_id, voice_choice, style,
+            on_stage=on_stage, on_slides=on_slides, on_video=on_video
+        )
+        presentation_jobs.succeed(job_id, **presentation)
+    except Exception as e:
+        print(f"Error in presentation job {job_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        presentation_jobs.fail(job_id, f"Failed to generate presentation: {detail}")
+
+def _get_job_or_404(job_id):
+    job = presentation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+def _job_result(job):
+    result = job["result"]
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "error": job["error"],
+        "presentation": {
+            "slides": result.get("slides", []),
+            "scripts": result.get("scripts", []),
+            # None for slides whose video hasn't finished yet
+            "video_urls": [s["video_url"] for s in job["slides"]],
+            "voice_id": result.get("voice_id"),
+            "video_file_id": result.get("video_file_id")
+        }
+    }
+
+@router.post("/presentation/jobs", status_code=202)
+async def submit_presentation_job(
+    background_tasks: BackgroundTasks,
+    ppt_blob: str = Body(...),
+    face_blob: str = Body(...),
+    voice_blob: str = Body(None),
+    voice_id: str = Body(None),
+    voice_choice: str = Body("upload"),
+    style: str = Body("professional")
+):
+    """
+    Queue a presentation generation and return its job id immediately
+    """
+    _check_voice_config(voice_blob, voice_id, voice_choice)
+    job_id = presentation_jobs.create(
+        stages=JOB_STAGES,
+        params={"ppt_blob": ppt_blob, "face_blob": face_blob, "voice_choice": voice_choice, "style": style}
+    )
+    background_tasks.add_task(
+        _run_presentation_job, job_id, ppt_blob, face_blob, voice_blob, voice_id, voice_choice, style
+    )
+    print(f"Queued presentation job {job_id}: ppt={ppt_blob}, face={face_blob}")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/generate/presentation/jobs/{job_id}",
+        "result_url": f"/generate/presentation/jobs/{job_id}/result",
+        "events_url": f"/generate/presentation/jobs/{job_id}/events"
+    }
+
+@router.get("/presentation/jobs/{job_id}")
+def get_presentation_job(job_id: str):
+    """
+    Per-stage progress and per-slide video completion
+    """
+    _get_job_or_404(job_id)
+    return presentation_jobs.summary(job_id)
+
+@router.get("/presentation/jobs/{job_id}/result")
+def get_presentation_job_result(job_id: str):
+    """
+    Everything produced so far; slides and finished videos show up before the job ends
+    """
+    return _job_result(_get_job_or_404(job_id))
+
+@router.get("/presentation/jobs/{job_id}/events")
+async def stream_presentation_job(job_id: str):
+    """
+    NDJSON stream: one status line per change, then the final result line
+    """
+    _get_job_or_404(job_id)
+
+    async def events():
+        seen = -1
+        sent_slides = False
+        sent_videos = set()
+        while True:
+            version = presentation_jobs.version(job_id)
+            if version is None:
+                return
+            if version != seen:
+                seen = version
+                status = presentation_jobs.summary(job_id)
+                if status is None:
+                    return
+                yield json.dumps({"type": "status", **status}) + "\n"
+                # The full job (with every slide image) is only copied when we need it
+                job = None
+                if not sent_slides or status["status"] in ("succeeded", "failed"):
+                    job = presentation_jobs.get(job_id)
+                    if job is None:
+                        return
+                if not sent_slides and job["result"].get("slides") is not None:
+                    sent_slides = True
+                    yield json.dumps({
+                        "type": "slides",
+                        "slides": job["result"]["slides"],
+                        "scripts": job["result"].get("scripts", [])
+                    }) + "\n"
+                for slide in status["slides"]:
+                    if slide["status"] == "done" and slide["index"] not in sent_videos:
+                        sent_videos.add(slide["index"])
+                        yield json.dumps({"type": "video", **slide}) + "\n"
+                if status["status"] in ("succeeded", "failed"):
+                    yield json.dumps({"type": "result", **_job_result(job)}) + "\n"
+                    return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @router.post("/script")
 async def generate_presentation_script(ppt_path: str, voice_sample_path: str):
     script = generate_script(ppt_path, voice_sample_path)
@@ -131,7 +322,26 @@ async def generate_presentation_avatar(face_video_path: str, voice_sample_path:
     avatar_path = generate_avatar(face_video_path, voice_sample_path, avatar_type)
     return {"message": "Avatar generated successfully", "avatar_path": avatar_path}
 
+@router.delete("/voice-cache")
+def clear_voice_cache(voice_id: str = Query(None, description="只删除这个 voiceId；不传则清空")):
+    removed = invalidate_voice_clone(voice_id=voice_id)
+    return {"ok": True, "removed": removed}
+
 @router.get("/speech")
-def get_speech(prompt: str = Query(..., description="输入的文本，比如PPT大纲")):
-    text = generate_speech(prompt)
+def get_speech(
+    prompt: str = Query(..., description="输入的文本，比如PPT大纲"),
+    use_cache: bool = Query(True, description="false 时跳过缓存，强制重新生成")
+):
+    text = generate_speech(prompt, use_cache=use_cache)
     return {"ok": True, "speech": text}
+
+@router.get("/file-speech")
+def get_file_speech(
+    file_path: str = Query(..., description="本地路径或 gs://bucket/path 的 .pptx/.pdf"),
+    batch_size: int = Query(None, ge=1, description="每次 Cohere 请求生成几页；默认 TTS_BATCH_SIZE，1 = 逐页请求")
+):
+    try:
+        speeches = file_to_speech_processor.file_to_speech(file_path, batch_size=batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "speeches": speeches}
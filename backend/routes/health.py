@@ -1,7 +1,29 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from utils.gcp import get_gcs
+from services.slide_cache import slide_cache
+from services.llm_cache import llm_cache
+from services.asr_router import asr_router
 
 router = APIRouter()
 
 @router.get("/")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/caches")
+def cache_stats():
+    return {"slides": slide_cache.stats(), "llm": llm_cache.stats()}
+
+@router.get("/gcs")
+def gcs_health():
+    # GCS is no longer touched at startup, so this is where credentials/bucket get checked
+    try:
+        return {"status": "ok", **get_gcs().verify()}
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "error", "detail": str(e)})
+
+@router.get("/asr")
+def asr_stats():
+    # Per-provider p50/p95, error rate and hedge wins used for routing
+    return asr_router.stats()
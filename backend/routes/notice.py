@@ -2,6 +2,7 @@ from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 import os
 import json
+from utils import topview_notices
 
 router = APIRouter()
 
@@ -18,6 +19,12 @@ async def topview_notice(request: Request):
         )
 
     notice_uuid = body_json.get("uuid")
+
+    # Wake up whoever is waiting on this task in utils/Topview.py
+    task_id = topview_notices.task_id_from_notice(body_json)
+    if task_id:
+        waited = topview_notices.resolve(task_id, body_json)
+        print(f"Topview notice for task {task_id} (waiter: {waited})")
     topview_uid = os.getenv("TOPVIEW_UID")
 
     return JSONResponse(
@@ -1,17 +1,13 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+import asyncio
+import json
+import queue
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from services.asr import ASRService
-from utils.gcp import GCSClient
-from utils.audio_preprocess import to_linear16_wav_file
-import uuid, os, tempfile
-import soundfile as sf
-from pydub import AudioSegment
-from services.answer_question import generate_answer
-from Topview import gen_video_answer
+from services.asr import ASRService, streaming_recognizer
+from services.question_pipeline import answer_question_audio
 
 router = APIRouter()
 asr = ASRService()
-gcs = GCSClient()
 
 @router.post("/audio-to-text")
 async def process_question_audio(
@@ -25,41 +21,101 @@ async def process_question_audio(
     """
     Process uploaded audio file and convert to text using ASR
     """
+    if not ppt_url:
+        raise HTTPException(status_code=400, detail="ppt_url is required")
     try:
-        # 先把上传的文件保存到临时目录
-        suffix = os.path.splitext(audio.filename)[-1]
-        temp_in = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}{suffix}")
-        with open(temp_in, "wb") as f:
-            f.write(await audio.read())
-
-        # 用 pydub 打开
-        audio_seg = AudioSegment.from_file(temp_in)
-
-        local_mp3_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.mp3")
-        audio_seg.export(local_mp3_path, format="mp3")
-
-        local_ppt_path = None
-        if ppt_url:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as ppt_temp:
-                gcs.download_file(ppt_url, ppt_temp.name)
-                local_ppt_path = ppt_temp.name
-
-        # 调用 generate_answer
-        speech = generate_answer(
-            page_num=slide_number,
-            audio_path=local_mp3_path,
-            ppt_path=local_ppt_path,
-            style="humorous",
-            max_tokens=50
+        result = await answer_question_audio(
+            await audio.read(), audio.filename, ppt_url, slide_number,
+            voice_id=voice_id, video_file_id=video_file_id,
+            style="humorous", max_tokens=50, language=language
         )
-
-        path = gen_video_answer(video_file_id, voice_id, speech)
-
         return JSONResponse({
             "code": 200,
-            "message": "Success",
-            "result_video_path": gen_video_answer
+            "message": "No speech detected" if result["no_speech"] else "Success",
+            "no_speech": result["no_speech"],
+            "result_video_path": result["video_path"],
+            "question": result["question"],
+            "answer": result["answer"],
+            "asr_provider": result["asr_provider"],
+            "timings": result["timings"]
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Audio conversion failed: {e}")
+
+
+@router.websocket("/stream")
+async def stream_question_audio(websocket: WebSocket, language: str = "en-US", sample_rate: int = 16000):
+    """
+    Live transcription while the audience member is still talking.
+
+    Client sends binary frames of raw mono PCM16 at `sample_rate`, then a
+    text frame {"type": "end"} when they stop. Server sends
+    {"type": "interim" | "final", "text", "stability"} as results come in
+    and {"type": "done", "transcript"} once recognition has finished.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    recognizer = streaming_recognizer(asr)
+    chunks: "queue.Queue[bytes | None]" = queue.Queue()
+    results: asyncio.Queue = asyncio.Queue()
+
+    def audio():
+        while (chunk := chunks.get()) is not None:
+            yield chunk
+
+    def recognize():
+        # 识别是阻塞的 gRPC 流，放在线程里跑，结果丢回事件循环
+        try:
+            for result in recognizer.streaming_recognize(audio(), language_code=language, sample_rate=sample_rate):
+                loop.call_soon_threadsafe(results.put_nowait, result)
+        except Exception as e:
+            loop.call_soon_threadsafe(results.put_nowait, {"error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(results.put_nowait, None)
+
+    async def receive_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    chunks.put(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        end = json.loads(message["text"]).get("type") == "end"
+                    except (ValueError, AttributeError):
+                        end = message["text"] == "end"
+                    if end:
+                        break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            chunks.put(None)
+
+    worker = asyncio.create_task(asyncio.to_thread(recognize))
+    receiver = asyncio.create_task(receive_audio())
+    finals = []
+    try:
+        while (result := await results.get()) is not None:
+            if "error" in result:
+                await websocket.send_json({"type": "error", "detail": result["error"]})
+                continue
+            if result["is_final"]:
+                finals.append(result["text"].strip())
+            await websocket.send_json({
+                "type": "final" if result["is_final"] else "interim",
+                "text": result["text"],
+                "stability": result["stability"],
+            })
+        await websocket.send_json({"type": "done", "transcript": " ".join(t for t in finals if t)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        chunks.put(None)
+        await worker
@@ -1,16 +1,23 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from services.ppt_processor import PPTProcessor
-from utils.gcp import GCSClient
+from typing import Optional
+from services.ppt_processor import PPTProcessor, IMAGE_MODES
+from services.deck_store import deck_store
+from utils.gcp import get_gcs
+from fastapi.responses import StreamingResponse
+import json
 import tempfile
 import os
 
 router = APIRouter()
 ppt_processor = PPTProcessor()
-gcs = GCSClient()
 
 class PPTProcessRequest(BaseModel):
     ppt_blob: str
+    # "inline" (base64 data URIs) or "url" (links to /slides/...); defaults to SLIDE_IMAGE_MODE
+    image_mode: Optional[str] = None
+    # Stream NDJSON events (deck, then per slide text and image) instead of one JSON body
+    stream: bool = False
 
 @router.post("/process-ppt")
 async def process_ppt_simple(request: PPTProcessRequest):
@@ -18,19 +25,24 @@ async def process_ppt_simple(request: PPTProcessRequest):
     Simply process PPT file and return slide data
     """
     print(f"Received PPT processing request: {request.ppt_blob}")
+    if request.image_mode and request.image_mode not in IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"image_mode must be one of {list(IMAGE_MODES)}")
+    if request.stream:
+        return StreamingResponse(_stream_slides(request), media_type="application/x-ndjson")
     try:
         # Download PPT file from GCS
         ppt_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
         
         try:
             # Download file
-            gcs.download_file(request.ppt_blob, ppt_temp.name)
+            get_gcs().download_file(request.ppt_blob, ppt_temp.name)
             
             # Process PPT file
-            slides_data = ppt_processor.extract_slides(ppt_temp.name)
+            slides_data = ppt_processor.extract_slides(ppt_temp.name, image_mode=request.image_mode)
             
             if not slides_data:
                 raise HTTPException(status_code=400, detail="No slides found in PPT file")
+            _save_deck_artifact(request.ppt_blob, ppt_temp.name)
             
             return {
                 "success": True,
@@ -43,9 +55,40 @@ async def process_ppt_simple(request: PPTProcessRequest):
             if os.path.exists(ppt_temp.name):
                 os.unlink(ppt_temp.name)
                 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"PPT processing error: {str(e)}")
         print(f"Full traceback: {error_details}")
         raise HTTPException(status_code=500, detail=f"Failed to process PPT: {str(e)}")
+
+
+def _save_deck_artifact(ppt_blob: str, local_path: str):
+    # The deck was just parsed, so this only writes <blob>.deck.json for the
+    # question/answer path; failing here must not fail the slides response
+    try:
+        deck_store.load(get_gcs(), ppt_blob, local_path=local_path)
+    except Exception as e:
+        print(f"Failed to save deck artifact for {ppt_blob}: {e}")
+
+def _stream_slides(request: PPTProcessRequest):
+    """
+    NDJSON body for stream=true. Runs in the threadpool, so the GCS download
+    and Spire work don't block the event loop.
+    """
+    ppt_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
+    try:
+        get_gcs().download_file(request.ppt_blob, ppt_temp.name)
+        for event in ppt_processor.iter_slides(ppt_temp.name, image_mode=request.image_mode):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        _save_deck_artifact(request.ppt_blob, ppt_temp.name)
+    except Exception as e:
+        import traceback
+        print(f"PPT streaming error: {str(e)}")
+        print(f"Full traceback: {traceback.format_exc()}")
+        yield json.dumps({"type": "error", "detail": f"Failed to process PPT: {str(e)}"}) + "\n"
+    finally:
+        if os.path.exists(ppt_temp.name):
+            os.unlink(ppt_temp.name)
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import re
+import tempfile
+from fastapi import APIRouter, HTTPException, Request, Response
+from services.ppt_processor import PPTProcessor
+from services.slide_cache import slide_blobs, slide_cache
+from utils.gcp import get_gcs
+from utils.hashing import sha256_file
+
+router = APIRouter()
+
+DECK_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def _rerender(deck_hash: str, slide_index: int):
+    """Render a slide again from the deck it came from (source.json next to the images)."""
+    source = slide_blobs.get_source(deck_hash)
+    if not source:
+        return None
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp:
+        tmp_path = tmp.name
+    try:
+        get_gcs().download_file(source, tmp_path)
+        if sha256_file(tmp_path) != deck_hash:
+            # The blob has been overwritten with a different deck since
+            print(f"Source {source} no longer matches deck {deck_hash[:12]}")
+            return None
+        image_bytes = PPTProcessor().render_slide_file(tmp_path, slide_index)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    if not image_bytes:
+        return None
+    slide_blobs.put_image(deck_hash, slide_index, image_bytes)
+    return image_bytes
+
+def _load_image(deck_hash: str, slide_index: int):
+    # local render cache -> durable copy in GCS -> re-render from the source deck
+    image_bytes = slide_cache.get_image(deck_hash, slide_index)
+    if image_bytes is not None:
+        return image_bytes
+    try:
+        image_bytes = slide_blobs.get_image(deck_hash, slide_index)
+        if image_bytes is None:
+            image_bytes = _rerender(deck_hash, slide_index)
+    except Exception as e:
+        print(f"Failed to restore slide {deck_hash[:12]}/{slide_index}: {e}")
+        raise HTTPException(status_code=503, detail="Slide image temporarily unavailable")
+    if image_bytes:
+        slide_cache.put_image(deck_hash, slide_index, image_bytes)
+    return image_bytes
+
+@router.get("/{deck_hash}/{slide_index}.png")
+def get_slide_image(deck_hash: str, slide_index: int, request: Request):
+    """
+    Rendered slide image. URLs are content-addressed (deck hash + index) and
+    backed by GCS, so browsers may cache them forever.
+    """
+    if not DECK_HASH_RE.match(deck_hash):
+        raise HTTPException(status_code=404, detail="Slide not found")
+
+    image_bytes = _load_image(deck_hash, slide_index)
+    if not image_bytes:
+        raise HTTPException(status_code=404, detail="Slide not found")
+
+    etag = f'"{hashlib.sha256(image_bytes).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image_bytes, media_type="image/png", headers=headers)
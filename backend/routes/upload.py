@@ -1,54 +1,70 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import tempfile, shutil, os
-from utils.gcp import GCSClient
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from typing import Optional
+from utils.gcp import get_gcs
+from services.direct_upload import issue_upload, finalize_upload, UploadVerificationError
+from utils.upload_stream import stream_to_gcs
 from dotenv import load_dotenv
 
 load_dotenv()
 router = APIRouter()
 
-from functools import lru_cache
-from utils.gcp import GCSClient
-
-@lru_cache(maxsize=1)
-def get_gcs() -> GCSClient:
-    return GCSClient()
-
-def _save_temp(upload: UploadFile) -> str:
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=f"_{upload.filename}")
-    with tmp as f:
-        shutil.copyfileobj(upload.file, f)
-    return tmp.name
+# Multipart body with a single "file" field; it is streamed straight into GCS
+# (see utils/upload_stream.py) instead of being spooled to a temp file first.
 
 @router.post("/ppt")
-async def upload_ppt(file: UploadFile = File(...)):
+async def upload_ppt(request: Request):
     print("uploading ppt")
-    path = _save_temp(file)
-    try:
-        blob = f"ppt/{file.filename}"
-        get_gcs().upload_file(path, blob)
-        url = get_gcs().generate_signed_url(blob, expiration=3600)
-        return {"ok": True, "url": url, "blob": blob}
-    finally:
-        os.unlink(path)
+    uploaded = await stream_to_gcs(request, get_gcs(), "ppt")
+    return {"ok": True, **uploaded}
 
 @router.post("/face")
-async def upload_face(file: UploadFile = File(...)):
-    path = _save_temp(file)
-    try:
-        blob = f"face/{file.filename}"
-        get_gcs().upload_file(path, blob)
-        url = get_gcs().generate_signed_url(blob, expiration=3600)
-        return {"ok": True, "url": url, "blob": blob}
-    finally:
-        os.unlink(path)
+async def upload_face(request: Request):
+    uploaded = await stream_to_gcs(request, get_gcs(), "face")
+    return {"ok": True, **uploaded}
 
 @router.post("/voice")
-async def upload_voice(file: UploadFile = File(...)):
-    path = _save_temp(file)
+async def upload_voice(request: Request):
+    uploaded = await stream_to_gcs(request, get_gcs(), "voice")
+    return {"ok": True, **uploaded}
+
+# Direct-to-bucket uploads: the browser asks /upload/sign for a URL, PUTs the
+# bytes to GCS itself, then calls /upload/finalize so we can verify the object.
+
+class SignUploadRequest(BaseModel):
+    kind: str  # ppt | face | voice
+    filename: str
+    content_type: str
+    size: int
+    mode: Optional[str] = None  # put | resumable
+
+class FinalizeUploadRequest(BaseModel):
+    blob: str
+    size: int
+    sha256: Optional[str] = None
+    md5: Optional[str] = None
+    upload_token: Optional[str] = None  # from /upload/sign; lets finalize delete a bad upload
+
+@router.post("/sign")
+async def sign_upload(req: SignUploadRequest, request: Request):
+    try:
+        return await asyncio.to_thread(
+            issue_upload, get_gcs(), req.kind, req.filename, req.content_type, req.size,
+            req.mode, request.headers.get("origin"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/finalize")
+async def finalize(req: FinalizeUploadRequest):
     try:
-        blob = f"voice/{file.filename}"
-        get_gcs().upload_file(path, blob)
-        url = get_gcs().generate_signed_url(blob, expiration=3600)
-        return {"ok": True, "url": url, "blob": blob}
-    finally:
-        os.unlink(path)
+        uploaded = await asyncio.to_thread(finalize_upload, get_gcs(), req.blob, req.size, req.sha256, req.md5,
+                                           req.upload_token)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadVerificationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, **uploaded}
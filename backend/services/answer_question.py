@@ -1,55 +1,49 @@
-from pptx import Presentation
-from PyPDF2 import PdfReader
-from generate_speech import generate_speech
-from google.cloud import storage
-import io
-import time
 import json
-from cloudfare_audio_to_text import cloudfare_audio_to_text
-from file_to_speech import PPTProcessor
+from services.cloudfare_audio_to_text import cloudfare_audio_to_text
+from services.deck_store import deck_store
+from services.deck_index import select_context
+from services import cohere_client
 import os
-from dotenv import load_dotenv
-import cohere
 
-# Load .env
-load_dotenv()
+# How much deck text goes into an answer prompt
+CONTEXT_TOP_K = int(os.getenv("ANSWER_CONTEXT_TOP_K", "3"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ANSWER_CONTEXT_TOKENS", "600"))
 
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-
-if not COHERE_API_KEY:
-    raise ValueError("COHERE_API_KEY not found in .env")
-
-# Initialize Cohere client
-co = cohere.Client(COHERE_API_KEY)
-
-def answer_prompt(ppt_text, question):
+def answer_prompt(context, question):
     """
-    Build the prompt to send to cohere API based on the extracted text
+    Build the prompt to send to cohere API based on the extracted text.
+    context is the list from deck_index.select_context: the current slide
+    plus the slides most relevant to the question.
     """
+    slide_content = "\n\n".join(
+        f"[Slide {c['page_num']}{' - current slide' if c['current'] else ''}]\n{c['text']}"
+        for c in context
+    )
     prompt = (
         f"You are answering a live audience question during a presentation."
         "Use the PowerPoint slide content provided as your reference. Respond in a short, clear, and conversational way—like you're speaking directly to the audience."
         "Focus only on the key idea from the slide that answers the question."
         "If explanation is needed, use simple everyday language and a quick example."
         "Do not give long background or summaries."
-        f"Slide content:\n{ppt_text['text']}\n\n"
+        f"Slide content:\n{slide_content}\n\n"
         f"Audience question:\n{question}\n\n"
     )
     return prompt
 
-def generate_answer(page_num, audio_path, ppt_path, style="humorous", max_tokens=50):
-    ppt_processor = PPTProcessor()
-    # ppt_path = "/Users/hanyunguo/Downloads/New Folder With Items/test.pptx"
-    # audio_path = "/Users/hanyunguo/Downloads/New Folder With Items/question.mp3"
-    ppt_text = ppt_processor.extract_ppt_text(ppt_path)
+def transcribe_question(audio_path):
+    """Cloudflare Whisper transcript of the recorded question."""
     transcript = cloudfare_audio_to_text(audio_path)
-    question = json.loads(transcript.body).get("speech-to-text", "")
-    prompt = answer_prompt(ppt_text[page_num], question)
+    return json.loads(transcript.body).get("speech-to-text", "")
+
+def answer_from_transcript(deck, page_num, question, style="humorous", max_tokens=50):
+    context = select_context(deck, page_num, question, k=CONTEXT_TOP_K, token_budget=CONTEXT_TOKEN_BUDGET)
+    prompt = answer_prompt(context, question)
     print(f"Generated answer for speech {page_num}:\n{prompt}\n")
 
     try:
-        # Updated Cohere API call
-        response = co.chat(
+        # Rate-limited Cohere call shared with the other callers; live Q&A gets the priority lane
+        response = cohere_client.chat(
+            interactive=True,
             model="command",  # Use current recommended model
             message=prompt,
             max_tokens=max_tokens
@@ -59,14 +53,21 @@ def generate_answer(page_num, audio_path, ppt_path, style="humorous", max_tokens
         speech_text = response.text
         return speech_text
 
-    except cohere.CohereError as e:
-        print(f"[Cohere Error] {e}")
-        return None
     except Exception as e:
-        print(f"[General Error] {e}")
+        print(f"[Cohere Error] {e}")
         return None
-    
-    return generate_speech
+
+def generate_answer(page_num, audio_path, ppt_path=None, style="humorous", max_tokens=50, deck=None):
+    """
+    deck is the parsed-deck artifact (services/deck_store.py); ppt_path is
+    only parsed when no artifact is passed in.
+    """
+    # ppt_path = "/Users/hanyunguo/Downloads/New Folder With Items/test.pptx"
+    # audio_path = "/Users/hanyunguo/Downloads/New Folder With Items/question.mp3"
+    if deck is None:
+        deck = deck_store.load_local(ppt_path)
+    question = transcribe_question(audio_path)
+    return answer_from_transcript(deck, page_num, question, style=style, max_tokens=max_tokens)
 
 if __name__ == "__main__":
     print(generate_answer())
\ No newline at end of file
@@ -1,15 +1,37 @@
-from typing import List
-from google.cloud import speech
-from utils.audio_preprocess import to_linear16_wav_file  # 如果你的工具在 utils/audio_io.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List
+from utils.audio_preprocess import to_linear16_wav_bytes, read_linear16, split_on_silence, pcm16_wav_bytes
+
+# Chunked mode: synchronous recognize() takes at most ~60 s of audio per call
+ASR_CHUNK_SECONDS = float(os.getenv("ASR_CHUNK_SECONDS", "50"))
+ASR_CHUNK_WORKERS = int(os.getenv("ASR_CHUNK_WORKERS", "8"))
 
 class ASRService:
+    """
+    Google Speech-to-Text. The google.cloud.speech import and the gRPC
+    client are created on first use, not when the routes are imported.
+    """
+
     def __init__(self):
-        self.client = speech.SpeechClient()
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import speech
+                    self._client = speech.SpeechClient()
+        return self._client
 
     def transcribe_local(self, path: str, language_code: str = "en-US", sample_rate: int = 16000) -> str:
-        wav_path = to_linear16_wav_file(path, target_sr=sample_rate)
-        with open(wav_path, "rb") as f:
-            data = f.read()
+        # 内存里转码，不落临时文件
+        data = to_linear16_wav_bytes(path, target_sr=sample_rate).getvalue()
+
+        from google.cloud import speech
 
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
@@ -23,6 +45,8 @@ class ASRService:
         return "\n".join(texts).strip()
 
     def transcribe_gcs(self, gcs_uri: str, language_code: str = "en-US", sample_rate: int = 16000) -> str:
+        from google.cloud import speech
+
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
             sample_rate_hertz=sample_rate,
@@ -34,3 +58,100 @@ class ASRService:
         resp = op.result(timeout=3600)
         texts = [r.alternatives[0].transcript for r in resp.results]
         return "\n".join(texts).strip()
+
+    def _recognize_pcm(self, wav_bytes: bytes, language_code: str, sample_rate: int) -> str:
+        from google.cloud import speech
+
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+        )
+        resp = self.client.recognize(config=config, audio=speech.RecognitionAudio(content=wav_bytes))
+        return " ".join(r.alternatives[0].transcript.strip() for r in resp.results if r.alternatives).strip()
+
+    def transcribe_chunked(self, path: str, language_code: str = "en-US", sample_rate: int = 16000,
+                           max_chunk_s: float = ASR_CHUNK_SECONDS, workers: int = ASR_CHUNK_WORKERS) -> Dict[str, Any]:
+        """
+        Long recordings without a long-running operation: split at silences
+        (energy VAD), recognize the chunks in parallel and stitch them back
+        in order. Wall-clock time follows the slowest chunk, not the length
+        of the recording. Returns {"text", "segments": [{"start", "end", "text"}]}
+        with times in seconds.
+        """
+        # Original level, so the VAD floor is absolute and all-noise chunks are dropped
+        y = read_linear16(path, target_sr=sample_rate, normalize=False)
+        bounds = split_on_silence(y, sample_rate, max_chunk_s=max_chunk_s)
+        print(f"[ASR] {len(y) / sample_rate:.1f}s of audio -> {len(bounds)} chunks")
+
+        def recognize(bound):
+            start, end = bound
+            return self._recognize_pcm(pcm16_wav_bytes(y[start:end], sample_rate), language_code, sample_rate)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(bounds) or 1))) as pool:
+            texts = list(pool.map(recognize, bounds))
+
+        segments = [
+            {"start": round(start / sample_rate, 2), "end": round(end / sample_rate, 2), "text": text}
+            for (start, end), text in zip(bounds, texts) if text
+        ]
+        return {"text": " ".join(seg["text"] for seg in segments), "segments": segments}
+
+    def streaming_recognize(self, audio_chunks: Iterable[bytes], language_code: str = "en-US",
+                            sample_rate: int = 16000, interim_results: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming recognition over raw mono LINEAR16 chunks, consumed as they
+        arrive. Yields {"text", "is_final", "stability"} for every result
+        Google sends back, interim hypotheses included. Blocking; run it in a thread.
+        """
+        from google.cloud import speech
+
+        config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=sample_rate,
+                language_code=language_code,
+                enable_automatic_punctuation=True,
+            ),
+            interim_results=interim_results,
+        )
+        requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks if chunk)
+        for response in self.client.streaming_recognize(config=config, requests=requests):
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                yield {
+                    "text": result.alternatives[0].transcript,
+                    "is_final": result.is_final,
+                    "stability": result.stability,
+                }
+
+class FakeStreamingASR:
+    """
+    Offline stand-in for ASRService.streaming_recognize (ASR_FAKE=true), for
+    local runs and smoke tests. It "hears" ASR_FAKE_TRANSCRIPT at
+    words_per_second of received audio and finalizes it when the stream ends.
+    """
+
+    def __init__(self, transcript: str = None, words_per_second: float = 2.5):
+        self.transcript = transcript or os.getenv("ASR_FAKE_TRANSCRIPT", "what does this slide mean")
+        self.words_per_second = words_per_second
+
+    def streaming_recognize(self, audio_chunks: Iterable[bytes], language_code: str = "en-US",
+                            sample_rate: int = 16000, interim_results: bool = True) -> Iterator[Dict[str, Any]]:
+        words = self.transcript.split()
+        received, heard = 0, 0
+        for chunk in audio_chunks:
+            received += len(chunk)
+            n = min(len(words), int(received / (2 * sample_rate) * self.words_per_second))
+            if interim_results and n > heard:
+                heard = n
+                yield {"text": " ".join(words[:n]), "is_final": False, "stability": 0.5}
+        yield {"text": self.transcript, "is_final": True, "stability": 1.0}
+
+def streaming_recognizer(asr: ASRService):
+    """The recognizer the streaming endpoint should use: the fake when ASR_FAKE=true."""
+    if os.getenv("ASR_FAKE", "false").lower() == "true":
+        return FakeStreamingASR()
+    return asr
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from services.answer_question import transcribe_question
+from services.asr import ASRService
+
+# Provider order used until there is enough latency data to route adaptively
+ASR_PROVIDERS = [p.strip() for p in os.getenv("ASR_PROVIDERS", "cloudflare,google").split(",") if p.strip()]
+# Fire the secondary if the primary hasn't answered within this many ms
+ASR_HEDGE_AFTER_MS = float(os.getenv("ASR_HEDGE_AFTER_MS", "2000"))
+ASR_HEDGE_DISABLED = os.getenv("ASR_HEDGE_DISABLED", "false").lower() == "true"
+# Latency samples kept per provider, and how many are needed before they count
+ASR_LATENCY_WINDOW = int(os.getenv("ASR_LATENCY_WINDOW", "200"))
+ASR_MIN_SAMPLES = int(os.getenv("ASR_MIN_SAMPLES", "5"))
+
+class LatencyTracker:
+    """Rolling latency (ms) and error counts for one provider."""
+
+    def __init__(self, window: int = ASR_LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, ms: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.samples.append(ms)
+            self.outcomes.append(ok)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < ASR_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            count = len(self.outcomes)
+        return {
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "calls": count,
+            "error_rate": round(self.error_rate(), 3),
+            "wins": self.wins,
+        }
+
+class ASRRouter:
+    """
+    Transcribe with whichever ASR provider is currently fastest, hedging
+    against its tail.
+
+    The primary is the provider with the lowest p95 (failing providers sort
+    last; configured order until there are ASR_MIN_SAMPLES samples). If it
+    hasn't answered after min(its p95, ASR_HEDGE_AFTER_MS) - or it fails - the
+    next provider is started too and the first successful transcript wins.
+    The loser keeps running in its thread and still feeds the latency stats.
+    """
+
+    def __init__(self, providers: Dict[str, Callable[[str, str], str]], order: List[str] = ASR_PROVIDERS,
+                 hedge_after_ms: float = ASR_HEDGE_AFTER_MS, hedge: bool = not ASR_HEDGE_DISABLED):
+        self.providers = providers
+        self.order = [p for p in order if p in providers] or list(providers)
+        self.hedge_after_ms = hedge_after_ms
+        self.hedge = hedge
+        self.latency = {name: LatencyTracker() for name in self.providers}
+
+    def ranked(self) -> List[str]:
+        def key(name):
+            tracker = self.latency[name]
+            p95 = tracker.percentile(0.95)
+            return (tracker.error_rate() > 0.5, p95 is None, p95 or 0.0, self.order.index(name))
+        return sorted(self.order, key=key)
+
+    def _hedge_delay(self, primary: str) -> float:
+        p95 = self.latency[primary].percentile(0.95)
+        ms = self.hedge_after_ms if p95 is None else min(p95, self.hedge_after_ms)
+        return ms / 1000
+
+    def _call(self, name: str, audio_path: str, language: str) -> str:
+        start = time.perf_counter()
+        ok = False
+        try:
+            text = self.providers[name](audio_path, language)
+            ok = True
+            return text
+        finally:
+            self.latency[name].record((time.perf_counter() - start) * 1000, ok)
+
+    async def transcribe(self, audio_path: str, language: str = "en-US") -> Dict[str, Any]:
+        """Returns {"text", "provider", "hedged", "ms"}; raises the last error if every provider fails."""
+        start = time.perf_counter()
+        candidates = self.ranked()
+        tasks: Dict[asyncio.Task, str] = {}
+
+        def launch(name):
+            task = asyncio.create_task(asyncio.to_thread(self._call, name, audio_path, language))
+            # A losing provider may fail after we've returned; don't leave its error unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks[task] = name
+
+        launch(candidates[0])
+        pending = set(tasks)
+        last_error = None
+        timeout = self._hedge_delay(candidates[0]) if self.hedge else None
+
+        while pending or len(tasks) < len(candidates):
+            if not pending:
+                launch(candidates[len(tasks)])
+                pending = {t for t in tasks if not t.done()}
+                timeout = None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Primary is past its budget: hedge with the next provider
+                if len(tasks) < len(candidates):
+                    launch(candidates[len(tasks)])
+                    pending = {t for t in tasks if not t.done()}
+                timeout = None
+                continue
+            for task in done:
+                if task.exception() is None:
+                    name = tasks[task]
+                    self.latency[name].wins += 1
+                    ms = round((time.perf_counter() - start) * 1000, 1)
+                    if len(tasks) > 1:
+                        print(f"[ASR] hedged: {name} answered first after {ms}ms")
+                    return {"text": task.result(), "provider": name, "hedged": len(tasks) > 1, "ms": ms}
+                last_error = task.exception()
+                print(f"[ASR] {tasks[task]} failed: {last_error}")
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": self.ranked(),
+            "hedge_after_ms": self.hedge_after_ms if self.hedge else None,
+            "providers": {name: tracker.stats() for name, tracker in self.latency.items()},
+        }
+
+
+_google = ASRService()
+
+asr_router = ASRRouter({
+    "cloudflare": lambda path, language: transcribe_question(path),
+    "google": lambda path, language: _google.transcribe_local(path, language_code=language),
+})
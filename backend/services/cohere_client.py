@@ -0,0 +1,171 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COHERE_API_KEY = os.getenv("COHERE_API_KEY")
+# Requests per minute our key is allowed; trial keys get 20 chat calls/min
+COHERE_RATE_PER_MINUTE = float(os.getenv("COHERE_RATE_PER_MINUTE", "20"))
+COHERE_BURST = int(os.getenv("COHERE_BURST", "3"))
+COHERE_MAX_CONCURRENCY = int(os.getenv("COHERE_MAX_CONCURRENCY", "4"))
+COHERE_MAX_RETRIES = int(os.getenv("COHERE_MAX_RETRIES", "4"))
+# Tokens and concurrency slots batch work (script generation) must leave free for
+# interactive calls (live Q&A), so a deck generation can't starve a question
+COHERE_INTERACTIVE_RESERVE = int(os.getenv("COHERE_INTERACTIVE_RESERVE", "1"))
+
+class TokenBucket:
+    """
+    Blocking token bucket: acquire() waits until a request may be sent.
+
+    Interactive callers go first: batch callers wait while one is waiting,
+    and never take the last `reserve` tokens.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int, reserve: int = COHERE_INTERACTIVE_RESERVE):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self.reserve = max(0, min(reserve, self.capacity - 1))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.interactive_waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, interactive: bool = False):
+        if interactive:
+            with self._lock:
+                self.interactive_waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    need = 1 if interactive else 1 + self.reserve
+                    if self.tokens >= need and (interactive or not self.interactive_waiting):
+                        self.tokens -= 1
+                        return
+                    wait = max(need - self.tokens, 0.05) / self.rate if self.tokens < need else 0.05
+                time.sleep(min(wait, 1.0))
+        finally:
+            if interactive:
+                with self._lock:
+                    self.interactive_waiting -= 1
+
+    def drain(self):
+        """Empty the bucket after a 429 so nobody else fires right away."""
+        with self._lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that halves on every 429 and grows back by one after
+    a run of successful calls (AIMD), never above max_limit. Batch callers
+    leave `reserve` slots free and yield to waiting interactive callers.
+    """
+
+    def __init__(self, max_limit: int, grow_after: int = 5, reserve: int = COHERE_INTERACTIVE_RESERVE):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.grow_after = grow_after
+        self.reserve = max(0, reserve)
+        self.in_flight = 0
+        self.interactive_waiting = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def _can_enter(self, interactive: bool) -> bool:
+        if interactive:
+            return self.in_flight < self.limit
+        # Keep at least one slot for batch work when the limit has been cut to 1
+        free_for_batch = self.limit - min(self.reserve, self.limit - 1)
+        return not self.interactive_waiting and self.in_flight < free_for_batch
+
+    @contextmanager
+    def slot(self, interactive: bool = False):
+        with self._cond:
+            if interactive:
+                self.interactive_waiting += 1
+            try:
+                while not self._can_enter(interactive):
+                    self._cond.wait()
+            finally:
+                if interactive:
+                    self.interactive_waiting -= 1
+                    self._cond.notify_all()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.grow_after and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+
+
+bucket = TokenBucket(COHERE_RATE_PER_MINUTE, COHERE_BURST)
+concurrency = AdaptiveConcurrency(COHERE_MAX_CONCURRENCY)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not COHERE_API_KEY:
+                    raise ValueError("COHERE_API_KEY not found in .env")
+                import cohere
+                _client = cohere.Client(COHERE_API_KEY)
+    return _client
+
+def _is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "TooManyRequestsError"
+
+def _retry_after(e: Exception, attempt: int) -> float:
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(30.0, 2.0 * (2 ** attempt)))
+
+def chat(interactive: bool = False, **kwargs):
+    """
+    co.chat shared by every Cohere caller: waits for the token bucket and a
+    concurrency slot, and backs off/retries on 429. interactive=True (someone
+    is waiting on the answer) jumps ahead of batch work in both.
+    """
+    for attempt in range(COHERE_MAX_RETRIES + 1):
+        with concurrency.slot(interactive):
+            bucket.acquire(interactive)
+            try:
+                response = get_client().chat(**kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == COHERE_MAX_RETRIES:
+                    raise
+                concurrency.on_throttle()
+                bucket.drain()
+                delay = _retry_after(e, attempt)
+                print(f"[Cohere] 429, retrying in {delay:.1f}s (concurrency now {concurrency.limit})")
+            else:
+                concurrency.on_success()
+                return response
+        time.sleep(delay)
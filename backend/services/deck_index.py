@@ -0,0 +1,100 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your", "we", "our",
+}
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    # Lowercase, drop stopwords and fold simple plurals ("deadlocks" -> "deadlock")
+    tokens = []
+    for t in TOKEN_RE.findall(text.lower()):
+        if t in STOPWORDS:
+            continue
+        if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+            t = t[:-1]
+        tokens.append(t)
+    return tokens
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting prompts
+    return max(1, len(text) // 4)
+
+def build_index(texts: List[str]) -> Dict[str, Any]:
+    """
+    BM25 statistics over slide texts. Plain dicts/lists so the index can be
+    stored inside the JSON deck artifact.
+    """
+    tf = [dict(Counter(tokenize(text))) for text in texts]
+    df = Counter()
+    for terms in tf:
+        df.update(terms.keys())
+    doc_len = [sum(terms.values()) for terms in tf]
+    return {
+        "tf": tf,
+        "df": dict(df),
+        "doc_len": doc_len,
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+    }
+
+def search(index: Dict[str, Any], query: str, k: int = 3) -> List[Tuple[int, float]]:
+    """Top-k (slide position, score) pairs with a positive BM25 score."""
+    n_docs = len(index["tf"])
+    terms = set(tokenize(query))
+    if not n_docs or not terms:
+        return []
+    avgdl = index["avgdl"] or 1.0
+    scores = []
+    for pos, doc_tf in enumerate(index["tf"]):
+        score = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * index["doc_len"][pos] / avgdl)
+        for term in terms:
+            freq = doc_tf.get(term)
+            if not freq:
+                continue
+            df = index["df"][term]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            score += idf * freq * (BM25_K1 + 1) / (freq + norm)
+        if score > 0:
+            scores.append((pos, score))
+    scores.sort(key=lambda x: -x[1])
+    return scores[:k]
+
+def _clip(text: str, tokens: int) -> str:
+    limit = tokens * 4
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " ..."
+
+def select_context(deck: Dict[str, Any], page_num: int, question: str,
+                   k: int = 3, token_budget: int = 600) -> List[Dict[str, Any]]:
+    """
+    Slides to show the LLM: the current slide first, then the top-k slides
+    most relevant to the question, until token_budget runs out.
+    Each entry is {"page_num", "text", "current"}.
+    """
+    slides = deck["slides"]
+    if not slides:
+        return []
+    index = deck.get("index") or build_index([s["text"] for s in slides])
+    current = max(0, min(page_num, len(slides) - 1))
+
+    budget = token_budget
+    current_text = _clip(slides[current]["text"], budget)
+    context = [{"page_num": slides[current]["page_num"], "text": current_text, "current": True}]
+    budget -= estimate_tokens(current_text)
+
+    for pos, _ in search(index, question, k + 1):
+        if pos == current:
+            continue
+        if budget <= 0 or len(context) > k:
+            break
+        text = _clip(slides[pos]["text"], budget)
+        context.append({"page_num": slides[pos]["page_num"], "text": text, "current": False})
+        budget -= estimate_tokens(text)
+    return context
@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from services.ppt_processor import PPTProcessor
+from services.slide_cache import slide_blobs
+from services.deck_index import build_index
+
+DECK_ARTIFACT_VERSION = 2
+DECK_ARTIFACT_SUFFIX = ".deck.json"
+
+class DeckStore:
+    """
+    One canonical parsed-deck artifact per PPTX blob.
+
+    The artifact (per-slide text, titles, shapes, render references and a
+    BM25 index over slide text for question answering) is
+    built once, uploaded next to the blob as <blob>.deck.json and kept in a
+    small in-memory LRU. Routes load it instead of re-downloading and
+    re-parsing the deck; it is rebuilt only when the blob's generation changes.
+    """
+
+    def __init__(self, processor: Optional[PPTProcessor] = None, max_memory: int = 32):
+        self.processor = processor or PPTProcessor()
+        self.max_memory = max_memory
+        self._memory: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def artifact_blob(blob_name: str) -> str:
+        return f"{blob_name}{DECK_ARTIFACT_SUFFIX}"
+
+    def build(self, ppt_path: str, source: Optional[str] = None, source_generation: Optional[int] = None) -> Dict[str, Any]:
+        parsed = self.processor.parse_deck(ppt_path)
+        deck_hash = parsed['deck_hash']
+        slides = []
+        for slide in parsed['slides']:
+            texts = [shape['text'] for shape in slide.get('shapes', [])]
+            slides.append({
+                'page_num': slide['id'],
+                'title': slide['title'],
+                'content': slide['content'],
+                'text': "\n".join(texts),
+                'shapes': slide.get('shapes', []),
+                'image': {
+                    'deck_hash': deck_hash,
+                    'index': slide['id'],
+                    'url': PPTProcessor.slide_image_url(deck_hash, slide['id'])
+                }
+            })
+        return {
+            'version': DECK_ARTIFACT_VERSION,
+            'source': source,
+            'source_generation': source_generation,
+            'deck_hash': deck_hash,
+            'total_slides': len(slides),
+            'slides': slides,
+            'index': build_index([s['text'] for s in slides])
+        }
+
+    def _remember(self, key: tuple, deck: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = deck
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def _recall(self, key: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            deck = self._memory.get(key)
+            if deck is not None:
+                self._memory.move_to_end(key)
+            return deck
+
+    def load(self, gcs, blob_name: str, local_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Artifact for a PPTX blob: memory -> <blob>.deck.json -> build.
+        Pass local_path when the PPTX is already on disk to skip the download.
+        """
+        blob = gcs.get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"PPT blob not found: {blob_name}")
+        key = (blob_name, blob.generation)
+
+        deck = self._recall(key)
+        if deck is not None:
+            return deck
+
+        artifact_name = self.artifact_blob(blob_name)
+        artifact = gcs.get_blob(artifact_name)
+        if artifact is not None:
+            try:
+                deck = json.loads(gcs.download_bytes(artifact_name))
+                if deck.get('version') == DECK_ARTIFACT_VERSION and deck.get('source_generation') == blob.generation:
+                    self._remember(key, deck)
+                    return deck
+                print(f"Deck artifact for {blob_name} is stale, rebuilding")
+            except Exception as e:
+                print(f"Failed to read deck artifact {artifact_name}: {e}")
+
+        tmp_path = None
+        try:
+            if local_path is None:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp:
+                    tmp_path = tmp.name
+                gcs.download_file(blob_name, tmp_path)
+                local_path = tmp_path
+            deck = self.build(local_path, source=blob_name, source_generation=blob.generation)
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        # Lets GET /slides/... re-render this deck's images if they were never stored
+        slide_blobs.put_source(deck['deck_hash'], blob_name, gcs=gcs)
+        gcs.upload_bytes(json.dumps(deck, ensure_ascii=False).encode("utf-8"), artifact_name,
+                         content_type="application/json")
+        print(f"Deck artifact saved: {artifact_name} ({deck['total_slides']} slides)")
+        self._remember(key, deck)
+        return deck
+
+    def load_local(self, ppt_path: str) -> Dict[str, Any]:
+        """Artifact for a local file (scripts/dev); parsing is cached by content hash."""
+        return self.build(ppt_path, source=ppt_path)
+
+
+def deck_pages(deck: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Non-empty slides as [{page_num, text}], the shape file_to_speech works with."""
+    return [{'page_num': s['page_num'], 'text': s['text']} for s in deck['slides'] if s['text'].strip()]
+
+
+deck_store = DeckStore()
@@ -0,0 +1,110 @@
+import base64
+import os
+import secrets
+from typing import Any, Dict, Optional
+from utils.upload_stream import UPLOAD_MAX_BYTES
+
+# Object prefixes browsers may upload to, and the content types each accepts
+UPLOAD_KINDS = {
+    "ppt": ("application/vnd.openxmlformats-officedocument.presentationml.presentation",
+            "application/vnd.ms-powerpoint", "application/pdf", "application/octet-stream"),
+    "face": ("video/mp4", "video/quicktime", "video/webm"),
+    "voice": ("audio/mpeg", "audio/wav", "audio/x-wav", "audio/mp4", "audio/webm", "audio/ogg"),
+}
+UPLOAD_URL_TTL = int(os.getenv("UPLOAD_URL_TTL", "900"))
+# Object metadata key marking a blob as issued by /upload/sign (GCS lower-cases it)
+UPLOAD_TOKEN_KEY = "upload-token"
+# Talking to a local emulator (fake-gcs-server etc.): no signing key, so only sessions work
+EMULATOR = bool(os.getenv("STORAGE_EMULATOR_HOST"))
+
+class UploadVerificationError(ValueError):
+    """The object in the bucket doesn't match what the client said it uploaded."""
+
+def issue_upload(gcs, kind: str, filename: str, content_type: str, size: int,
+                 mode: Optional[str] = None, origin: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Upload target for one object, <kind>/<filename>, locked to content_type.
+
+    mode "put" is a V4 signed PUT URL; "resumable" is a resumable session
+    URL (sized up front, resumable from the browser after a dropped
+    connection). Defaults to "resumable" against an emulator, "put" otherwise.
+    The returned upload_token is stored on the object and must be passed to
+    finalize_upload before it will delete a mismatched upload.
+    """
+    if kind not in UPLOAD_KINDS:
+        raise ValueError(f"Unknown upload kind: {kind}, allowed={list(UPLOAD_KINDS)}")
+    if content_type not in UPLOAD_KINDS[kind]:
+        raise ValueError(f"Content type {content_type} not allowed for {kind}")
+    if size <= 0 or size > UPLOAD_MAX_BYTES:
+        raise ValueError(f"Size must be between 1 and {UPLOAD_MAX_BYTES} bytes")
+    filename = os.path.basename(filename or "")
+    if not filename:
+        raise ValueError("filename is required")
+    mode = mode or ("resumable" if EMULATOR else "put")
+    blob = f"{kind}/{filename}"
+    token = secrets.token_urlsafe(16)
+    metadata = {UPLOAD_TOKEN_KEY: token}
+
+    if mode == "put":
+        if EMULATOR:
+            raise ValueError("Signed PUT URLs need a signing key; use mode=resumable with the emulator")
+        url = gcs.generate_upload_url(blob, content_type, expiration=UPLOAD_URL_TTL, metadata=metadata)
+        # The token header is part of the signature; the PUT fails without it
+        return {"blob": blob, "mode": mode, "method": "PUT", "upload_url": url, "upload_token": token,
+                "headers": {"Content-Type": content_type, f"x-goog-meta-{UPLOAD_TOKEN_KEY}": token},
+                "expires_in": UPLOAD_URL_TTL}
+    if mode == "resumable":
+        url = gcs.create_upload_session(blob, content_type, size=size, origin=origin, metadata=metadata)
+        # A session URL stays valid for about a week; it only accepts this object
+        return {"blob": blob, "mode": mode, "method": "PUT", "upload_url": url, "upload_token": token,
+                "headers": {"Content-Type": content_type}}
+    raise ValueError(f"Unknown upload mode: {mode}, allowed=['put', 'resumable']")
+
+def finalize_upload(gcs, blob_name: str, size: int, sha256: Optional[str] = None,
+                    md5: Optional[str] = None, upload_token: Optional[str] = None,
+                    expiration: int = 3600) -> Dict[str, Any]:
+    """
+    Check a browser upload landed intact before anything uses it.
+
+    size and md5 (hex or base64) are compared against the object metadata;
+    sha256, if given, is verified by streaming the object back. A mismatched
+    object is deleted so a broken upload can't be picked up later - but only
+    if it carries the upload_token /upload/sign issued for it; anything else
+    (e.g. a file from the regular upload routes) is reported and left alone.
+    """
+    kind = blob_name.split("/", 1)[0]
+    if kind not in UPLOAD_KINDS or "/" not in blob_name:
+        raise ValueError(f"Not an upload blob: {blob_name}")
+    blob = gcs.get_blob(blob_name)
+    if blob is None:
+        raise FileNotFoundError(f"Upload not found: {blob_name}")
+
+    problems = []
+    if blob.size != size:
+        problems.append(f"size {blob.size} != {size}")
+    if md5:
+        expected = md5 if len(md5) != 32 else base64.b64encode(bytes.fromhex(md5)).decode()
+        if blob.md5_hash and blob.md5_hash != expected:
+            problems.append("md5 mismatch")
+    if sha256 and not problems:
+        actual = gcs.sha256_blob(blob_name)
+        if actual != sha256.lower():
+            problems.append("sha256 mismatch")
+    stored_token = (blob.metadata or {}).get(UPLOAD_TOKEN_KEY)
+    owned = bool(upload_token) and stored_token is not None and secrets.compare_digest(stored_token, upload_token)
+    if problems:
+        if owned:
+            gcs.delete_file(blob_name)
+        else:
+            problems.append("not deleted: no matching upload_token")
+        raise UploadVerificationError(f"Upload {blob_name} failed verification: {', '.join(problems)}")
+
+    if sha256 or stored_token is not None:
+        # Drop the token once verified, so a later bad finalize can't delete the good file
+        blob.metadata = {**(blob.metadata or {}), UPLOAD_TOKEN_KEY: None}
+        if sha256:
+            blob.metadata["sha256"] = sha256.lower()
+        blob.patch()
+    url = gcs.generate_signed_url(blob_name, expiration=expiration, check_exists=False)
+    return {"blob": blob_name, "url": url, "size": blob.size, "sha256": sha256.lower() if sha256 else None,
+            "generation": blob.generation}
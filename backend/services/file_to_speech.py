@@ -1,14 +1,19 @@
-from pptx import Presentation
-from PyPDF2 import PdfReader
-from services.generate_speech import generate_speech
-from google.cloud import storage
+import os
+from services.generate_speech import batch_capacity, generate_speech, generate_speech_batch
+from services.deck_store import deck_pages
+from utils.gcp import get_storage_client
 import io
-import time
+from concurrent.futures import ThreadPoolExecutor
+from services.cohere_client import COHERE_MAX_CONCURRENCY
+
+# Slides per Cohere request by default (capped by batch_capacity() to fit COHERE_BATCH_MAX_TOKENS); 1 = one request per slide
+TTS_BATCH_SIZE = int(os.getenv("TTS_BATCH_SIZE", "8"))
 
 class PPTProcessor:
-    def __init__(self):
-        # Initialize the official GCS client
-        self.gcs = storage.Client()
+    @property
+    def gcs(self):
+        # Shared, lazily created storage client (see utils/gcp.py)
+        return get_storage_client()
 
     def extract_ppt_text(self, ppt_path):
         bucket_name = "hack-the-north-bucket"
@@ -26,6 +31,8 @@ class PPTProcessor:
             with open(ppt_path, "rb") as f:
                 data = f.read()
 
+        from pptx import Presentation
+
         prs = Presentation(io.BytesIO(data))
         slides_text = []
 
@@ -42,6 +49,8 @@ class PPTProcessor:
         return slides_text
 
     def extract_pdf_text(self, pdf_path):
+        from PyPDF2 import PdfReader
+
         text = []
         with open(pdf_path, "rb") as f:
             reader = PdfReader(f)
@@ -66,23 +75,58 @@ class PPTProcessor:
         )
         return prompt
 
-    def file_to_speech(self, file_path: str) -> dict:
-        if file_path.endswith(".pptx"):
+    def file_to_speech(self, file_path: str = None, deck: dict = None, batch_size: int = None) -> dict:
+        """
+        deck is a parsed-deck artifact (services/deck_store.py); when given,
+        file_path is not read at all.
+
+        Scripts are generated batch_size pages per Cohere request (default
+        TTS_BATCH_SIZE; 1 means one request per page). Pages the batched
+        reply doesn't cover cleanly fall back to one request each.
+        """
+        if deck is not None:
+            pages = deck_pages(deck)
+        elif file_path.endswith(".pptx"):
             pages = self.extract_ppt_text(file_path)
         elif file_path.endswith(".pdf"):
             pages = self.extract_pdf_text(file_path)
         else:
             raise ValueError("Unsupported file format: Only .pptx and .pdf are supported")
 
-        result = {}
-        for page in pages:
+        if batch_size is None:
+            batch_size = TTS_BATCH_SIZE
+        if batch_size > 1:
+            return self._file_to_speech_batched(pages, batch_size)
+
+        def _speech(page):
             print(f"Processing Page {page['page_num']}...")
-            prompt = self.build_prompt(page)
-            speech_text = generate_speech(prompt)
-            result[page["page_num"]] = speech_text
-            time.sleep(7)  # avoid API rate limits
+            return generate_speech(self.build_prompt(page))
+
+        # Pacing comes from the shared Cohere rate limiter, not a fixed sleep
+        with ThreadPoolExecutor(max_workers=COHERE_MAX_CONCURRENCY) as pool:
+            speeches = list(pool.map(_speech, pages))
+
+        return {page["page_num"]: speech_text for page, speech_text in zip(pages, speeches)}
+
+    def _file_to_speech_batched(self, pages, batch_size: int) -> dict:
+        # One request per window: batch_size * max_tokens has to fit in the batch token cap
+        batch_size = min(batch_size, batch_capacity())
+        windows = [pages[i:i + batch_size] for i in range(0, len(pages), batch_size)]
+
+        def _window(window):
+            print(f"Processing Pages {window[0]['page_num']}-{window[-1]['page_num']} in one request...")
+            prompts = [self.build_prompt(page) for page in window]
+            speeches = generate_speech_batch(prompts)
+            for i, speech_text in enumerate(speeches):
+                if speech_text is None:
+                    print(f"Batch missed Page {window[i]['page_num']}, retrying on its own...")
+                    speeches[i] = generate_speech(prompts[i])
+            return speeches
+
+        with ThreadPoolExecutor(max_workers=COHERE_MAX_CONCURRENCY) as pool:
+            speeches = [s for window_speeches in pool.map(_window, windows) for s in window_speeches]
 
-        return result
+        return {page["page_num"]: speech_text for page, speech_text in zip(pages, speeches)}
 
 
 if __name__ == "__main__":
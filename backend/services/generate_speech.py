@@ -1,34 +1,125 @@
+import json
 import os
-from dotenv import load_dotenv
-import cohere
+from typing import List, Optional
+from services import cohere_client
+from services.llm_cache import llm_cache, LLM_CACHE_DISABLED
 
-# Load .env
-load_dotenv()
+COHERE_MODEL = "command"  # Use current recommended model
+# Upper bound on max_tokens for one batched request
+BATCH_MAX_TOKENS = int(os.getenv("COHERE_BATCH_MAX_TOKENS", "4000"))
 
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
+def generate_speech(user_input, style="humorous", max_tokens=800, use_cache=True):
+    """
+    use_cache=False (or LLM_CACHE_DISABLED=true) always calls Cohere, but
+    the fresh result still refreshes the cache.
+    """
+    cache_key = llm_cache.key(COHERE_MODEL, style, max_tokens, user_input)
+    if use_cache and not LLM_CACHE_DISABLED:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-if not COHERE_API_KEY:
-    raise ValueError("COHERE_API_KEY not found in .env")
-
-# Initialize Cohere client
-co = cohere.Client(COHERE_API_KEY)
-
-def generate_speech(user_input, style="humorous", max_tokens=800):
     try:
-        # Updated Cohere API call
-        response = co.chat(
-            model="command",  # Use current recommended model
+        # Rate-limited Cohere call shared with the other callers
+        response = cohere_client.chat(
+            model=COHERE_MODEL,
             message=f"Write a {style} speech about: {user_input}",
             max_tokens=max_tokens
         )
         
         # Get the text response
         speech_text = response.text
+        if speech_text:
+            llm_cache.set(cache_key, speech_text)
         return speech_text
 
-    except cohere.CohereError as e:
+    except Exception as e:
         print(f"[Cohere Error] {e}")
         return None
-    except Exception as e:
-        print(f"[General Error] {e}")
-        return None
\ No newline at end of file
+
+def _batch_message(user_inputs, style):
+    items = "\n\n".join(f"### Item {i}\n{text}" for i, text in enumerate(user_inputs, start=1))
+    return (
+        f"Write a {style} speech about each numbered item below. Each speech must stand on its own.\n\n"
+        f"{items}\n\n"
+        "Return ONLY a JSON array, one object per item, in this exact form: "
+        '[{"item": 1, "speech": "..."}, {"item": 2, "speech": "..."}]. '
+        "No text before or after the JSON."
+    )
+
+def batch_capacity(max_tokens=800) -> int:
+    """How many items fit in one batched request without the reply outgrowing BATCH_MAX_TOKENS."""
+    return max(1, BATCH_MAX_TOKENS // max(1, max_tokens))
+
+def _split_batch(text, count) -> List[Optional[str]]:
+    """
+    Map a batched reply back to items; anything missing or malformed is None.
+
+    Objects are decoded one at a time from the first "[", so a reply cut
+    off by the token cap still yields its complete items, and prose after
+    the array (even with brackets in it) is ignored.
+    """
+    out: List[Optional[str]] = [None] * count
+    text = text or ""
+    pos = text.find("[")
+    if pos < 0:
+        return out
+    decoder = json.JSONDecoder()
+    pos += 1
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            break
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break  # truncated (or garbled) from here on
+        if not isinstance(item, dict):
+            continue
+        speech = item.get("speech")
+        try:
+            index = int(item.get("item")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < count and isinstance(speech, str) and speech.strip():
+            out[index] = speech.strip()
+    return out
+
+def generate_speech_batch(user_inputs, style="humorous", max_tokens=800, use_cache=True) -> List[Optional[str]]:
+    """
+    Generate speeches for several inputs in one Cohere request (more if
+    they don't fit in BATCH_MAX_TOKENS; see batch_capacity).
+
+    Results are cached per input under the same key as generate_speech, so
+    batched and single calls share hits. Items the model dropped or mangled
+    come back as None for the caller to retry one by one.
+    """
+    keys = [llm_cache.key(COHERE_MODEL, style, max_tokens, text) for text in user_inputs]
+    results: List[Optional[str]] = [None] * len(user_inputs)
+    if use_cache and not LLM_CACHE_DISABLED:
+        results = [llm_cache.get(key) for key in keys]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if not todo:
+        return results
+
+    # Each request gets max_tokens per item, so the cap never truncates a full reply
+    size = batch_capacity(max_tokens)
+    for start in range(0, len(todo), size):
+        chunk = todo[start:start + size]
+        try:
+            response = cohere_client.chat(
+                model=COHERE_MODEL,
+                message=_batch_message([user_inputs[i] for i in chunk], style),
+                max_tokens=max_tokens * len(chunk)
+            )
+            speeches = _split_batch(response.text, len(chunk))
+        except Exception as e:
+            print(f"[Cohere Error] {e}")
+            continue
+
+        for i, speech in zip(chunk, speeches):
+            if speech:
+                results[i] = speech
+                llm_cache.set(keys[i], speech)
+    return results
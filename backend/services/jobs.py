@@ -0,0 +1,145 @@
+import copy
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+class JobStore:
+    """
+    In-memory registry of long-running generation jobs.
+
+    Pipelines run in worker threads and report progress here; routes read
+    snapshots so the HTTP request never has to wait for the pipeline.
+    """
+
+    def __init__(self, max_jobs: int = 200):
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, stages: List[str], params: Optional[Dict[str, Any]] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "params": params or {},
+            "created_at": now,
+            "updated_at": now,
+            "current_stage": None,
+            "stages": {
+                name: {"status": "pending", "started_at": None, "finished_at": None}
+                for name in stages
+            },
+            "slides": [],
+            "result": {},
+            "error": None,
+            "version": 0,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        return job_id
+
+    def _evict(self):
+        # Drop the oldest finished jobs once we exceed the cap
+        if len(self._jobs) <= self.max_jobs:
+            return
+        finished = sorted(
+            (j for j in self._jobs.values() if j["status"] in ("succeeded", "failed")),
+            key=lambda j: j["updated_at"],
+        )
+        for job in finished[: len(self._jobs) - self.max_jobs]:
+            del self._jobs[job["id"]]
+
+    def _touch(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        job["version"] += 1
+
+    def start_stage(self, job_id: str, stage: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["current_stage"] = stage
+            entry = job["stages"].setdefault(stage, {"status": "pending", "started_at": None, "finished_at": None})
+            entry["status"] = "running"
+            entry["started_at"] = time.time()
+            self._touch(job)
+
+    def finish_stage(self, job_id: str, stage: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            entry = job["stages"].setdefault(stage, {"status": "pending", "started_at": None, "finished_at": None})
+            entry["status"] = "done"
+            entry["finished_at"] = time.time()
+            self._touch(job)
+
+    def update_result(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["result"].update(fields)
+            self._touch(job)
+
+    def init_slides(self, job_id: str, count: int):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["slides"] = [{"index": i, "status": "pending", "video_url": None} for i in range(count)]
+            self._touch(job)
+
+    def set_slide_video(self, job_id: str, index: int, video_url: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["slides"][index].update(status="done", video_url=video_url)
+            self._touch(job)
+
+    def succeed(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["result"].update(fields)
+            job["status"] = "succeeded"
+            job["current_stage"] = None
+            self._touch(job)
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "failed"
+            job["error"] = error
+            if job["current_stage"]:
+                job["stages"][job["current_stage"]]["status"] = "failed"
+            self._touch(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a deep copy of the job so callers can't race the worker."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def version(self, job_id: str) -> Optional[int]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["version"] if job else None
+
+    def summary(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status view without the (potentially huge) result payload."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            # Copy only stages/slides; result.slides can hold every slide's PNG
+            slides = [dict(s) for s in job["slides"]]
+            return {
+                "job_id": job["id"],
+                "status": job["status"],
+                "current_stage": job["current_stage"],
+                "stages": {name: dict(entry) for name, entry in job["stages"].items()},
+                "videos_done": sum(1 for s in slides if s["status"] == "done"),
+                "videos_total": len(slides),
+                "slides": slides,
+                "error": job["error"],
+                "created_at": job["created_at"],
+                "updated_at": job["updated_at"],
+            }
+
+
+presentation_jobs = JobStore()
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from utils.sqlite_cache import SQLiteCache, cache_path
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "false").lower() == "true"
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip()
+
+class LLMCache:
+    """
+    Two-tier cache for LLM completions: an in-memory LRU in front of a
+    SQLite store on disk. Both tiers honour the same TTL.
+    """
+
+    def __init__(self, disk: SQLiteCache, ttl: float = LLM_CACHE_TTL, max_memory: int = LLM_CACHE_MEMORY_ITEMS):
+        self.disk = disk
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, style: str, max_tokens: int, prompt: str) -> str:
+        raw = json.dumps([model, style, max_tokens, normalize_prompt(prompt)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        hit = self.disk.get(key, with_expiry=True)
+        with self._lock:
+            if hit is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        text, expires_at = hit
+        # Keep the disk entry's own expiry in memory; never longer than ttl from now
+        expires_at = now + self.ttl if expires_at is None else min(expires_at, now + self.ttl)
+        self._remember(key, text, expires_at)
+        return text
+
+    def set(self, key: str, text: str):
+        self.disk.set(key, text, ttl=self.ttl)
+        self._remember(key, text, time.time() + self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "memory_items": len(self._memory),
+            }
+
+
+llm_cache = LLMCache(SQLiteCache(cache_path("llm.sqlite3"), table="responses"))
@@ -1,14 +1,29 @@
-from spire.presentation import *
 from typing import List, Dict, Any
 import os
 import io
 import base64
+import hashlib
+import struct
+from services.slide_cache import slide_blobs, slide_cache
+from services.slide_render_pool import render_pool as default_render_pool
+from utils.hashing import sha256_file
+
+# "inline" embeds every slide as a base64 data URI; "url" only returns a link
+# to GET /slides/{deck_hash}/{id}.png plus size and hash. URL-mode images are
+# copied to GCS (slide_blobs) first, so the link outlives the local cache.
+SLIDE_IMAGE_MODE = os.getenv("SLIDE_IMAGE_MODE", "inline")
+SLIDE_IMAGE_BASE_URL = os.getenv("SLIDE_IMAGE_BASE_URL", "")
+IMAGE_MODES = ("inline", "url")
+# spire.presentation is imported where a deck is opened: it boots a .NET
+# runtime, which workers that never touch a PPT shouldn't pay for
 
 class PPTProcessor:
-    def __init__(self):
-        pass
+    def __init__(self, cache=slide_cache, render_pool=default_render_pool, blob_store=slide_blobs):
+        self.cache = cache
+        self.render_pool = render_pool
+        self.blob_store = blob_store
 
-    def extract_slide_image(self, slide, slide_index: int) -> str:
+    def render_slide_png(self, slide, slide_index: int) -> bytes:
         try:
             print(f"Starting image conversion for slide {slide_index}")
             
@@ -18,23 +33,198 @@ class PPTProcessor:
             image_bytes = image_stream.ToArray()
             print(f"Image bytes extracted for slide {slide_index}, size: {len(image_bytes)}")
             
-            img_str = base64.b64encode(image_bytes).decode()
-            print(f"Base64 encoding completed for slide {slide_index}")
-            
-            return f"data:image/png;base64,{img_str}"
+            return bytes(image_bytes)
             
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             print(f"Error converting slide {slide_index} to image: {e}")
             print(f"Full traceback: {error_details}")
+            return b""
+
+    @staticmethod
+    def to_data_uri(image_bytes: bytes) -> str:
+        if not image_bytes:
             return ""
+        img_str = base64.b64encode(image_bytes).decode()
+        return f"data:image/png;base64,{img_str}"
+
+    def extract_slide_image(self, slide, slide_index: int) -> str:
+        return self.to_data_uri(self.render_slide_png(slide, slide_index))
+
+    @staticmethod
+    def png_size(image_bytes: bytes) -> tuple:
+        """(width, height) from the PNG IHDR chunk, without decoding the image"""
+        if len(image_bytes) < 24 or image_bytes[:8] != b"\x89PNG\r\n\x1a\n":
+            return None, None
+        return struct.unpack(">II", image_bytes[16:24])
+
+    @staticmethod
+    def slide_image_url(deck_hash: str, slide_index: int) -> str:
+        return f"{SLIDE_IMAGE_BASE_URL}/slides/{deck_hash}/{slide_index}.png"
+
+    def _stored_images(self, deck_hash: str, image_mode: str):
+        """Indices already in the durable store (url mode), or None if it can't be reached."""
+        if image_mode != "url":
+            return None
+        try:
+            return self.blob_store.stored_indices(deck_hash)
+        except Exception as e:
+            print(f"Slide blob store unavailable ({e}), falling back to inline images")
+            return None
+
+    def _make_durable(self, deck_hash: str, slide_index: int, image_bytes: bytes, stored) -> bool:
+        if stored is None:
+            return False
+        if slide_index not in stored:
+            try:
+                self.blob_store.put_image(deck_hash, slide_index, image_bytes)
+            except Exception as e:
+                print(f"Failed to store slide {slide_index} image ({e}), sending it inline")
+                return False
+            stored.add(slide_index)
+        return True
+
+    def _image_fields(self, deck_hash: str, slide_index: int, image_bytes: bytes, image_mode: str,
+                      stored=None) -> Dict[str, Any]:
+        if image_mode != "url":
+            return {'image': self.to_data_uri(image_bytes)}
+        if not image_bytes:
+            return {'image': '', 'image_width': None, 'image_height': None, 'image_hash': None}
+        width, height = self.png_size(image_bytes)
+        # Only hand out a URL the durable store can back; otherwise inline this one
+        durable = self._make_durable(deck_hash, slide_index, image_bytes, stored)
+        return {
+            'image': self.slide_image_url(deck_hash, slide_index) if durable else self.to_data_uri(image_bytes),
+            'image_width': width,
+            'image_height': height,
+            'image_hash': hashlib.sha256(image_bytes).hexdigest()
+        }
+
+    def render_slide_file(self, ppt_path: str, slide_index: int) -> bytes:
+        """Render one slide (1-based) of a deck on disk, e.g. to restore a missing slide image."""
+        from spire.presentation import Presentation
+        presentation = Presentation()
+        try:
+            presentation.LoadFromFile(ppt_path)
+            if not 1 <= slide_index <= presentation.Slides.Count:
+                return b""
+            return self.render_slide_png(presentation.Slides[slide_index - 1], slide_index)
+        finally:
+            try:
+                presentation.Dispose()
+            except Exception as e:
+                print(f"Error disposing presentation: {e}")
+
+    def _slide_text(self, slide, slide_index: int) -> Dict[str, Any]:
+        print(f"Processing slide {slide_index}...")
+        
+        slide_content = {
+            'id': slide_index,
+            'title': '',
+            'content': '',
+            'image': '',
+            'shapes': []
+        }
+
+        for shape in slide.Shapes:
+            try:
+                if hasattr(shape, "TextFrame") and shape.TextFrame is not None:
+                    text = shape.TextFrame.Text.strip()
+                    if text:
+                        if shape.Name and "title" in shape.Name.lower():
+                            slide_content['title'] = text
+                        elif not slide_content['title'] and len(text) < 100:
+                            slide_content['title'] = text
+                        else:
+                            if slide_content['content']:
+                                slide_content['content'] += "\n" + text
+                            else:
+                                slide_content['content'] = text
+
+                        slide_content['shapes'].append({
+                            'type': 'text',
+                            'text': text,
+                            'name': shape.Name
+                        })
+            except Exception as e:
+                print(f"Error processing shape: {e}")
+                continue
+
+        # If no title found, use slide number as title
+        if not slide_content['title']:
+            slide_content['title'] = f"Slide {slide_index}"
+
+        print(f"Slide {slide_index} - Title: '{slide_content['title']}'")
+        print(f"Slide {slide_index} - Content: '{slide_content['content']}'")
+        print(f"Slide {slide_index} - Shapes: {len(slide_content['shapes'])}")
+        
+        return slide_content
+
+    def _iter_slide_images(self, deck_hash: str, ppt_path: str, presentation, slide_indices: List[int]):
+        """
+        Yield (slide_index, png_bytes) in slide order: cached ones from the
+        render cache, the rest rendered across the worker pool (or in-process
+        for a single slide)
+        """
+        cached = {}
+        missing = []
+        for slide_index in slide_indices:
+            image_bytes = self.cache.get_image(deck_hash, slide_index)
+            if image_bytes is None:
+                missing.append(slide_index)
+            else:
+                cached[slide_index] = image_bytes
+
+        rendered = iter(())
+        if missing:
+            print(f"Rendering {len(missing)} slides ({len(cached)} cached)...")
+            if self.render_pool.enabled and len(missing) > 1:
+                rendered = self.render_pool.render_iter(ppt_path, missing)
+            else:
+                rendered = ((i, self.render_slide_png(presentation.Slides[i - 1], i)) for i in missing)
+
+        for slide_index in slide_indices:
+            if slide_index in cached:
+                yield slide_index, cached[slide_index]
+                continue
+            _, image_bytes = next(rendered)
+            if image_bytes:
+                self.cache.put_image(deck_hash, slide_index, image_bytes)
+            yield slide_index, image_bytes
+
+    def iter_slides(self, ppt_path: str, image_mode: str | None = None):
+        """
+        Parse and render a deck incrementally. Yields events:
+        {"type": "deck", ...} first, then {"type": "slide", ...} (text, no
+        image) for every slide, then {"type": "slide_image", ...} per slide in
+        order as each render finishes, and finally {"type": "done", ...}.
+        Text never waits on rendering.
+        """
+        image_mode = image_mode or SLIDE_IMAGE_MODE
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"Unsupported image_mode: {image_mode}, allowed={list(IMAGE_MODES)}")
+        deck_hash = sha256_file(ppt_path)
+
+        meta = self.cache.get_meta(deck_hash)
+        if meta is not None and self.cache.has_deck(deck_hash):
+            print(f"Slide cache hit for {ppt_path} ({deck_hash[:12]}), {len(meta)} slides")
+            yield {'type': 'deck', 'deck_hash': deck_hash, 'total_slides': len(meta), 'cached': True}
+            for slide in meta:
+                yield {'type': 'slide', **slide}
+            stored = self._stored_images(deck_hash, image_mode)
+            for slide in meta:
+                image_bytes = self.cache.get_image(deck_hash, slide['id']) or b""
+                yield {'type': 'slide_image', 'id': slide['id'],
+                       **self._image_fields(deck_hash, slide['id'], image_bytes, image_mode, stored)}
+            yield {'type': 'done', 'total_slides': len(meta)}
+            return
 
-    def extract_slides(self, ppt_path: str) -> List[Dict[str, Any]]:
         presentation = None
         try:
             print(f"Loading PPT file: {ppt_path}")
             
+            from spire.presentation import Presentation
             presentation = Presentation()
             presentation.LoadFromFile(ppt_path)
             
@@ -43,63 +233,23 @@ class PPTProcessor:
             slides_data = []
             
             for i, slide in enumerate(presentation.Slides):
-                print(f"Processing slide {i + 1}...")
-                
-                slide_content = {
-                    'id': i + 1,
-                    'title': '',
-                    'content': '',
-                    'image': '',
-                    'shapes': []
-                }
-                
-                for shape in slide.Shapes:
-                    try:
-                        if hasattr(shape, "TextFrame") and shape.TextFrame is not None:
-                            text = shape.TextFrame.Text.strip()
-                            if text:
-                                if shape.Name and "title" in shape.Name.lower():
-                                    slide_content['title'] = text
-                                elif not slide_content['title'] and len(text) < 100:
-                                    slide_content['title'] = text
-                                else:
-                                    if slide_content['content']:
-                                        slide_content['content'] += "\n" + text
-                                    else:
-                                        slide_content['content'] = text
-                                
-                                slide_content['shapes'].append({
-                                    'type': 'text',
-                                    'text': text,
-                                    'name': shape.Name
-                                })
-                    except Exception as e:
-                        print(f"Error processing shape: {e}")
-                        continue
-                
-                # If no title found, use slide number as title
-                if not slide_content['title']:
-                    slide_content['title'] = f"Slide {i + 1}"
-                
-                print(f"Slide {i + 1} - Title: '{slide_content['title']}'")
-                print(f"Slide {i + 1} - Content: '{slide_content['content']}'")
-                print(f"Slide {i + 1} - Shapes: {len(slide_content['shapes'])}")
-                
-                print(f"Converting slide {i + 1} to image...")
-                slide_content['image'] = self.extract_slide_image(slide, i + 1)
-                print(f"Slide {i + 1} image conversion completed")
-                
+                slide_content = self._slide_text(slide, i + 1)
+                del slide_content['image']
                 slides_data.append(slide_content)
-            
+            self.cache.put_meta(deck_hash, slides_data)
+
+            yield {'type': 'deck', 'deck_hash': deck_hash, 'total_slides': len(slides_data), 'cached': False}
+            # All text goes out before the first render is awaited
+            for slide_content in slides_data:
+                yield {'type': 'slide', **slide_content}
+            stored = self._stored_images(deck_hash, image_mode)
+            images = self._iter_slide_images(deck_hash, ppt_path, presentation, [s['id'] for s in slides_data])
+            for slide_index, image_bytes in images:
+                yield {'type': 'slide_image', 'id': slide_index,
+                       **self._image_fields(deck_hash, slide_index, image_bytes, image_mode, stored)}
+
             print(f"Successfully processed {len(slides_data)} slides")
-            return slides_data
-            
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"Error processing PPT file: {e}")
-            print(f"Full traceback: {error_details}")
-            return []
+            yield {'type': 'done', 'total_slides': len(slides_data)}
         finally:
             # Ensure presentation is disposed
             if presentation is not None:
@@ -109,6 +259,55 @@ class PPTProcessor:
                 except Exception as e:
                     print(f"Error disposing presentation: {e}")
 
+    def parse_deck(self, ppt_path: str) -> Dict[str, Any]:
+        """
+        Text, titles and shapes per slide without rendering any images.
+        Reuses the render cache's text when the deck has been seen before.
+        """
+        deck_hash = sha256_file(ppt_path)
+        slides_data = self.cache.get_meta(deck_hash)
+        if slides_data is not None:
+            return {'deck_hash': deck_hash, 'slides': slides_data}
+
+        presentation = None
+        try:
+            from spire.presentation import Presentation
+            presentation = Presentation()
+            presentation.LoadFromFile(ppt_path)
+            slides_data = []
+            for i, slide in enumerate(presentation.Slides):
+                slide_content = self._slide_text(slide, i + 1)
+                del slide_content['image']
+                slides_data.append(slide_content)
+            self.cache.put_meta(deck_hash, slides_data)
+            return {'deck_hash': deck_hash, 'slides': slides_data}
+        finally:
+            if presentation is not None:
+                try:
+                    presentation.Dispose()
+                except Exception as e:
+                    print(f"Error disposing presentation: {e}")
+
+    def extract_slides(self, ppt_path: str, image_mode: str | None = None) -> List[Dict[str, Any]]:
+        try:
+            slides_data = []
+            by_id = {}
+            for event in self.iter_slides(ppt_path, image_mode):
+                kind = event.pop('type')
+                if kind == 'slide':
+                    slides_data.append(event)
+                    by_id[event['id']] = event
+                elif kind == 'slide_image':
+                    by_id[event.pop('id')].update(event)
+            return slides_data
+            
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            print(f"Error processing PPT file: {e}")
+            print(f"Full traceback: {error_details}")
+            return []
+
     def generate_slide_script(self, slide_data: Dict[str, Any], style: str = "professional") -> str:
         title = slide_data.get('title', '')
         content = slide_data.get('content', '')
@@ -157,6 +356,7 @@ class PPTProcessor:
             if not os.path.exists(ppt_path):
                 return False
             
+            from spire.presentation import Presentation
             presentation = Presentation()
             presentation.LoadFromFile(ppt_path)
             slide_count = presentation.Slides.Count
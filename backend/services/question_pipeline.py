@@ -0,0 +1,117 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Awaitable, Dict, Optional
+from services.answer_question import answer_from_transcript
+from services.asr_router import asr_router
+from services.deck_store import deck_store
+from utils.audio_preprocess import prepare_for_asr
+from utils.gcp import get_gcs
+from utils.Topview import render_answer_video
+
+# Containers Cloudflare Whisper decodes itself; anything else is re-encoded to MP3 first
+ASR_NATIVE_SUFFIXES = {".mp3", ".wav", ".webm", ".ogg", ".flac", ".m4a"}
+
+class StageTimings:
+    """Wall-clock milliseconds per pipeline stage, plus the total so far."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    async def run(self, name: str, awaitable: Awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def mark(self, name: str):
+        """Record the time since the pipeline started under `name`."""
+        self.stages[name] = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def summary(self) -> Dict[str, float]:
+        return {**self.stages, "total": round((time.perf_counter() - self.started) * 1000, 1)}
+
+def _save_upload(data: bytes, suffix: str) -> str:
+    path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}{suffix}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def _to_mp3(src_path: str) -> str:
+    # 用到时再 import pydub，启动时不加载
+    from pydub import AudioSegment
+    mp3_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.mp3")
+    AudioSegment.from_file(src_path).export(mp3_path, format="mp3")
+    return mp3_path
+
+async def _transcribe(data: bytes, suffix: str, language: str, timings: StageTimings) -> Dict[str, Any]:
+    audio_path = await timings.run("save_audio", asyncio.to_thread(_save_upload, data, suffix))
+    paths = [audio_path]
+    native = suffix.lower() in ASR_NATIVE_SUFFIXES
+    try:
+        # VAD gate + trim: dead air never reaches ASR, pure silence skips it entirely
+        prep = await timings.run("vad", asyncio.to_thread(prepare_for_asr, audio_path, force_wav=not native))
+        if not prep["has_speech"]:
+            print(f"No speech in {prep['duration_s']}s recording, skipping ASR")
+            return {"text": "", "provider": None, "hedged": False, "ms": 0.0, "no_speech": True}
+        if prep["trimmed"]:
+            print(f"Trimmed question audio {prep['duration_s']}s -> {prep['speech_s']}s")
+            audio_path = prep["path"]
+            paths.append(audio_path)
+        elif not native:
+            # Couldn't decode it ourselves either; let pydub/ffmpeg have a go
+            audio_path = await timings.run("transcode", asyncio.to_thread(_to_mp3, audio_path))
+            paths.append(audio_path)
+        # Hedged across ASR providers (services/asr_router.py)
+        return await timings.run("transcribe", asr_router.transcribe(audio_path, language))
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+async def answer_question_audio(data: bytes, filename: str, ppt_url: str, slide_number: int,
+                                voice_id: Optional[str], video_file_id: Optional[str],
+                                style: str = "humorous", max_tokens: int = 50,
+                                language: str = "en-US") -> Dict[str, Any]:
+    """
+    Recorded question -> answer video, as fast as the slowest dependency allows.
+
+    Loading the deck artifact and transcribing the question don't depend on
+    each other, so they run concurrently; the answer (Cohere) and the
+    avatar render follow. Silence is trimmed before ASR and a recording
+    with no speech stops right there (no_speech=True, no answer or video).
+    Untrimmed audio Whisper can decode is sent as uploaded, without a
+    re-encode. Returns the video path, the transcript, the answer text, the
+    ASR provider that won and per-stage timings in ms.
+    """
+    timings = StageTimings()
+    suffix = os.path.splitext(filename or "")[-1] or ".webm"
+
+    # 解析好的 deck 存在 blob 旁边，不用每个问题都重新下载/解析 PPT
+    deck, transcript = await asyncio.gather(
+        timings.run("load_deck", asyncio.to_thread(deck_store.load, get_gcs(), ppt_url)),
+        _transcribe(data, suffix, language, timings),
+    )
+    question = transcript["text"]
+    timings.mark("deck_and_transcript")
+    if not question.strip():
+        # Nothing was asked: don't spend a Cohere call and a Topview render on it
+        result = {"video_path": None, "question": "", "answer": None, "no_speech": True,
+                  "asr_provider": transcript["provider"], "timings": timings.summary()}
+        print(f"Question pipeline timings (ms): {result['timings']} (no speech)")
+        return result
+
+    answer = await timings.run("answer", asyncio.to_thread(
+        answer_from_transcript, deck, slide_number, question, style=style, max_tokens=max_tokens))
+    if not answer:
+        raise RuntimeError("No answer generated")
+
+    path = await timings.run("render_video", render_answer_video(video_file_id, voice_id, answer))
+    result = {"video_path": path, "question": question, "answer": answer, "no_speech": False,
+              "asr_provider": transcript["provider"], "timings": timings.summary()}
+    print(f"Question pipeline timings (ms): {result['timings']}")
+    return result
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from utils.sqlite_cache import CACHE_DIR
+
+SLIDE_CACHE_DIR = os.getenv("SLIDE_CACHE_DIR", os.path.join(CACHE_DIR, "slides"))
+SLIDE_CACHE_MAX_BYTES = int(os.getenv("SLIDE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# GCS prefix for the durable copy of slide images handed out as URLs
+SLIDE_BLOB_PREFIX = os.getenv("SLIDE_BLOB_PREFIX", "slides")
+
+class SlideRenderCache:
+    """
+    On-disk cache of rendered slides, keyed by PPTX content hash + slide index.
+
+    Layout: <root>/<deck_hash>/meta.json (text/shapes per slide) and
+    <root>/<deck_hash>/<index>.png. Files are touched on every hit and the
+    least recently used ones are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, root: str = SLIDE_CACHE_DIR, max_bytes: int = SLIDE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _deck_dir(self, deck_hash: str) -> str:
+        return os.path.join(self.root, deck_hash)
+
+    def image_path(self, deck_hash: str, index: int) -> str:
+        return os.path.join(self._deck_dir(deck_hash), f"{index}.png")
+
+    def _meta_path(self, deck_hash: str) -> str:
+        return os.path.join(self._deck_dir(deck_hash), "meta.json")
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_meta(self, deck_hash: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._meta_path(deck_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(path)
+            return meta
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put_meta(self, deck_hash: str, slides: List[Dict[str, Any]]):
+        data = json.dumps(slides, ensure_ascii=False).encode("utf-8")
+        self._write(self._meta_path(deck_hash), data)
+        self._grow(len(data))
+
+    def get_image(self, deck_hash: str, index: int) -> Optional[bytes]:
+        path = self.image_path(deck_hash, index)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        return data
+
+    def put_image(self, deck_hash: str, index: int, png: bytes):
+        self._write(self.image_path(deck_hash, index), png)
+        self._grow(len(png))
+
+    def has_deck(self, deck_hash: str) -> bool:
+        """True if the deck's text and every slide image are cached."""
+        meta = self.get_meta(deck_hash)
+        if meta is None:
+            return False
+        return all(os.path.exists(self.image_path(deck_hash, s["id"])) for s in meta)
+
+    def _scan(self) -> List[tuple]:
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for deck in os.scandir(self.root):
+            if not deck.is_dir():
+                continue
+            for entry in os.scandir(deck.path):
+                if entry.is_file() and not entry.name.count(".tmp."):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _grow(self, nbytes: int):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += nbytes
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Oldest first until we're back under 90% of the cap
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._scan())
+        size = sum(s for _, s, _ in entries)
+        for _, nbytes, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= nbytes
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            deck_dir = os.path.dirname(path)
+            if not os.listdir(deck_dir):
+                os.rmdir(deck_dir)
+        self._size = size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class SlideBlobStore:
+    """
+    Durable copy of URL-mode slide images in GCS, shared by every instance.
+
+    Layout: <prefix>/<deck_hash>/<index>.png, plus <prefix>/<deck_hash>/source.json
+    naming the PPTX blob the deck came from so a missing image can be
+    re-rendered. The local SlideRenderCache stays in front as the fast path.
+    """
+
+    def __init__(self, prefix: str = SLIDE_BLOB_PREFIX, gcs=None):
+        self.prefix = prefix.strip("/")
+        self._gcs = gcs
+
+    @property
+    def gcs(self):
+        if self._gcs is None:
+            from utils.gcp import get_gcs
+            return get_gcs()
+        return self._gcs
+
+    def image_blob(self, deck_hash: str, index: int) -> str:
+        return f"{self.prefix}/{deck_hash}/{index}.png"
+
+    def _source_blob(self, deck_hash: str) -> str:
+        return f"{self.prefix}/{deck_hash}/source.json"
+
+    def stored_indices(self, deck_hash: str) -> set:
+        """Slide indices whose image is already in the bucket (one list call)."""
+        names = self.gcs.list_files(f"{self.prefix}/{deck_hash}/")
+        stored = set()
+        for name in names:
+            stem = os.path.basename(name)[:-len(".png")]
+            if name.endswith(".png") and stem.isdigit():
+                stored.add(int(stem))
+        return stored
+
+    def put_image(self, deck_hash: str, index: int, png: bytes):
+        self.gcs.upload_bytes(png, self.image_blob(deck_hash, index), content_type="image/png")
+
+    def get_image(self, deck_hash: str, index: int) -> Optional[bytes]:
+        blob_name = self.image_blob(deck_hash, index)
+        if self.gcs.get_blob(blob_name) is None:
+            return None
+        return self.gcs.download_bytes(blob_name)
+
+    def put_source(self, deck_hash: str, source_blob: str, gcs=None):
+        data = json.dumps({"blob": source_blob}).encode("utf-8")
+        (gcs or self.gcs).upload_bytes(data, self._source_blob(deck_hash), content_type="application/json")
+
+    def get_source(self, deck_hash: str) -> Optional[str]:
+        blob_name = self._source_blob(deck_hash)
+        if self.gcs.get_blob(blob_name) is None:
+            return None
+        return json.loads(self.gcs.download_bytes(blob_name)).get("blob")
+
+
+slide_cache = SlideRenderCache()
+slide_blobs = SlideBlobStore()
@@ -0,0 +1,183 @@
+import multiprocessing as mp
+import os
+import itertools
+import threading
+import time
+from multiprocessing import TimeoutError as PoolTimeoutError
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Every uvicorn worker gets its own pool of .NET/Spire processes, so keep the default small
+SLIDE_RENDER_WORKERS = int(os.getenv("SLIDE_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds one slide may take once a worker has started it (time spent queued doesn't count)
+SLIDE_RENDER_TIMEOUT = float(os.getenv("SLIDE_RENDER_TIMEOUT", "60"))
+# How often a waiting render checks whether its slide has overrun
+SLIDE_RENDER_POLL = 0.5
+
+# Per-worker state: the deck currently loaded in this process
+_worker_deck = {"key": None, "presentation": None}
+# Per-worker queue for "task started" reports back to the parent
+_started_queue = None
+
+def _init_worker(started_queue=None):
+    global _started_queue
+    _started_queue = started_queue
+    # Pay the Spire/.NET runtime start-up once per worker, not once per slide
+    import spire.presentation  # noqa: F401
+
+def _load_deck(ppt_path: str):
+    from spire.presentation import Presentation
+
+    st = os.stat(ppt_path)
+    key = (ppt_path, st.st_mtime_ns, st.st_size)
+    if _worker_deck["key"] != key:
+        if _worker_deck["presentation"] is not None:
+            try:
+                _worker_deck["presentation"].Dispose()
+            except Exception as e:
+                print(f"Error disposing presentation in render worker: {e}")
+        presentation = Presentation()
+        presentation.LoadFromFile(ppt_path)
+        _worker_deck.update(key=key, presentation=presentation)
+    return _worker_deck["presentation"]
+
+def _render_slide(ppt_path: str, slide_index: int, token: Optional[int] = None) -> bytes:
+    """Runs in a worker: render one slide (1-based) of an already-loaded deck."""
+    if _started_queue is not None and token is not None:
+        _started_queue.put((token, time.time()))
+    presentation = _load_deck(ppt_path)
+    image_stream = presentation.Slides[slide_index - 1].SaveAsImage()
+    return bytes(image_stream.ToArray())
+
+
+class _PoolHandle:
+    """A process pool plus the start times its workers report for each task."""
+
+    def __init__(self, workers: int):
+        ctx = mp.get_context("spawn")
+        self.queue = ctx.SimpleQueue()
+        self.pool = ctx.Pool(workers, initializer=_init_worker, initargs=(self.queue,))
+        self.started: Dict[int, float] = {}
+        self.users = 0  # renders still reading results from this pool
+        self.retired_at: Optional[float] = None
+        threading.Thread(target=self._listen, name="slide-render-starts", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            token, started_at = item
+            self.started[token] = started_at
+
+    def shutdown(self, graceful: bool = False):
+        if graceful:
+            self.pool.close()
+            self.pool.join()
+        else:
+            self.pool.terminate()
+        self.queue.put(None)
+
+
+class SlideRenderPool:
+    """
+    Process pool that rasterizes slides in parallel.
+
+    Each worker keeps a warm Spire runtime and loads a deck only once, no
+    matter how many of its slides it renders. A slide comes back empty if it
+    runs longer than `timeout` seconds after a worker picked it up; time
+    spent queued behind other decks doesn't count. Only such an overrun
+    retires the pool: new renders get a fresh pool, and the old one is
+    terminated once every render still reading from it has finished.
+    """
+
+    def __init__(self, workers: int = SLIDE_RENDER_WORKERS, timeout: float = SLIDE_RENDER_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._current: Optional[_PoolHandle] = None
+        self._retired: List[_PoolHandle] = []
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1
+
+    def _acquire(self) -> _PoolHandle:
+        with self._lock:
+            if self._current is None:
+                self._current = _PoolHandle(self.workers)
+            self._current.users += 1
+            return self._current
+
+    def _retire(self, handle: _PoolHandle):
+        with self._lock:
+            if self._current is handle:
+                # New work goes to a fresh pool; this one drains first
+                self._current = None
+                handle.retired_at = time.time()
+                self._retired.append(handle)
+
+    def _release(self, handle: _PoolHandle):
+        with self._lock:
+            handle.users -= 1
+            drained = handle in self._retired and handle.users == 0
+            if drained:
+                self._retired.remove(handle)
+        if drained:
+            # Nobody is waiting on it any more; this kills the stuck worker
+            handle.shutdown()
+
+    def _wait(self, handle: _PoolHandle, result, token: int) -> Optional[bytes]:
+        """Result of one task, or None once it overran its timeout after starting."""
+        while True:
+            try:
+                return result.get(timeout=SLIDE_RENDER_POLL)
+            except PoolTimeoutError:
+                pass
+            # Not started yet means queued behind other work: keep waiting. On a
+            # retired pool the stuck workers may never free up, so the clock
+            # starts at retirement for tasks that haven't begun.
+            started_at = handle.started.get(token) or handle.retired_at
+            if started_at is not None and time.time() - started_at > self.timeout:
+                return None
+
+    def render_iter(self, ppt_path: str, slide_indices: List[int]) -> Iterator[Tuple[int, bytes]]:
+        """Yield (slide_index, png_bytes) in the order given, as each slide is ready."""
+        handle = self._acquire()
+        pending = []
+        try:
+            for i in slide_indices:
+                token = next(self._tokens)
+                pending.append((i, token, handle.pool.apply_async(_render_slide, (ppt_path, i, token))))
+            for slide_index, token, result in pending:
+                try:
+                    image = self._wait(handle, result, token)
+                except Exception as e:
+                    print(f"Error converting slide {slide_index} to image in worker: {e}")
+                    image = b""
+                if image is None:
+                    print(f"Slide {slide_index} render ran over {self.timeout}s, skipping")
+                    if token in handle.started:
+                        # A worker is wedged on it; stop sending new decks to this pool
+                        self._retire(handle)
+                    image = b""
+                yield slide_index, image
+        finally:
+            for _, token, _ in pending:
+                handle.started.pop(token, None)
+            self._release(handle)
+
+    def render(self, ppt_path: str, slide_indices: List[int]) -> Dict[int, bytes]:
+        return dict(self.render_iter(ppt_path, slide_indices))
+
+    def close(self):
+        with self._lock:
+            current, self._current = self._current, None
+            retired, self._retired = self._retired, []
+        if current is not None:
+            current.shutdown(graceful=True)
+        for handle in retired:
+            handle.shutdown()
+
+
+render_pool = SlideRenderPool()
@@ -1,12 +1,29 @@
 import os
+import sys
+import json
 import argparse
+import subprocess
 from dotenv import load_dotenv
 
-from backend.services.generate_speech import generate_speech
-from backend.utils.gcp import GCSClient
+# 后端模块之间用 services./utils. 互相 import（和 uvicorn 在 backend/ 下启动时一致），
+# 所以 python -m backend.tools.smoke_tests 也要把 backend/ 放进 sys.path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from services.generate_speech import generate_speech
+from utils.gcp import GCSClient
+from services.direct_upload import issue_upload, finalize_upload
 
 load_dotenv()
 
+# 冷启动预算：新进程里 import main 的耗时上限，以及启动时不允许被加载的重依赖
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3"))
+HEAVY_MODULES = [
+    "librosa", "soundfile", "spire", "pydub", "pptx", "PyPDF2", "cohere",
+    "google.cloud.speech", "google.cloud.storage",
+]
+
 def test_cohere():
     """调用 Cohere 生成一段短文案，验证 COHERE_API_KEY 是否可用"""
     prompt = "Give 3 common solutions for deadlocks in database systems. 100 words max."
@@ -58,6 +75,133 @@ def test_gcs_basic():
             os.remove("gcs_test_file.txt")
         return False
 
+def test_direct_upload():
+    """浏览器直传链路：/upload/sign -> PUT 到 bucket -> /upload/finalize 校验（可用 STORAGE_EMULATOR_HOST 指向本地模拟器）"""
+    import hashlib
+    import httpx
+
+    data = b"direct upload smoke test\n" * 1024
+    blob_name = None
+    try:
+        gcs = GCSClient()
+        target = issue_upload(gcs, "voice", "smoke_test.wav", "audio/wav", len(data))
+        blob_name = target["blob"]
+        print(f"✅ 已签发 {target['mode']} 上传地址: {blob_name}")
+
+        r = httpx.put(target["upload_url"], content=data, headers=target["headers"], timeout=60)
+        r.raise_for_status()
+        print("✅ 已直传到 bucket")
+
+        uploaded = finalize_upload(gcs, blob_name, len(data), sha256=hashlib.sha256(data).hexdigest(),
+                                   upload_token=target["upload_token"])
+        print("✅ finalize 校验通过:", uploaded["url"])
+
+        gcs.delete_file(blob_name)
+        print("🎉 直传链路 OK")
+        return True
+    except Exception as e:
+        print("❌ 直传测试失败：", e)
+        return False
+
+def test_stream_abort():
+    """流式上传中途断开：resumable session 要被取消，bucket 里不能留下半截对象"""
+    import asyncio
+    from starlette.requests import Request
+    from utils.upload_stream import stream_to_gcs, UPLOAD_CHUNK_SIZE
+
+    boundary = "smoketestboundary"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+            f"filename=\"smoke_abort.bin\"\r\nContent-Type: application/octet-stream\r\n\r\n").encode()
+    # 多于一个分块，保证断开前已经有数据传到 session 里
+    body = head + b"x" * (UPLOAD_CHUNK_SIZE + 1024)
+    messages = [{"type": "http.request", "body": body[i:i + 1024 * 1024], "more_body": True}
+                for i in range(0, len(body), 1024 * 1024)]
+    messages.append({"type": "http.disconnect"})
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload/voice",
+             "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]}
+    blob_name = "test_uploads/smoke_abort.bin"
+    try:
+        gcs = GCSClient()
+        try:
+            asyncio.run(stream_to_gcs(Request(scope, receive), gcs, "test_uploads"))
+            print("❌ 断开的上传居然成功了")
+            return False
+        except Exception as e:
+            print(f"✅ 上传按预期中断: {type(e).__name__}")
+        if gcs.get_blob(blob_name) is not None:
+            print(f"❌ 中断的上传在 bucket 里留下了对象: {blob_name}")
+            gcs.delete_file(blob_name)
+            return False
+        print("🎉 中断的上传没有留下对象")
+        return True
+    except Exception as e:
+        print("❌ 中断上传测试失败：", e)
+        return False
+
+def test_startup():
+    """冷启动检查：新进程里 import main，超出时间预算或提前加载了重依赖就算失败"""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        print("❌ import main 失败：\n", proc.stderr[-2000:])
+        return False
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    ok = True
+    if result["heavy"]:
+        print(f"❌ 启动时加载了重依赖（应在首次使用时再 import）: {result['heavy']}")
+        ok = False
+    if result["seconds"] > STARTUP_BUDGET_SECONDS:
+        print(f"❌ import main 耗时 {result['seconds']:.2f}s，超过预算 {STARTUP_BUDGET_SECONDS:.2f}s")
+        ok = False
+    if ok:
+        print(f"✅ 冷启动 OK：import main 耗时 {result['seconds']:.2f}s（预算 {STARTUP_BUDGET_SECONDS:.2f}s）")
+    return ok
+
+def test_asr_stream():
+    """流式识别 WebSocket：用本地假识别器（ASR_FAKE=true）跑一遍 /questions/stream，不联网"""
+    os.environ["ASR_FAKE"] = "true"
+    os.environ.setdefault("ASR_FAKE_TRANSCRIPT", "what does this slide mean")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routes.question_handler import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/questions")
+    pcm = b"\x00\x00" * 16000  # 1 秒静音，16k PCM16
+    try:
+        with TestClient(app).websocket_connect("/questions/stream?sample_rate=16000") as ws:
+            for _ in range(3):
+                ws.send_bytes(pcm)
+            ws.send_text(json.dumps({"type": "end"}))
+            messages = []
+            while True:
+                msg = ws.receive_json()
+                messages.append(msg)
+                if msg["type"] in ("done", "error"):
+                    break
+        interim = [m for m in messages if m["type"] == "interim"]
+        done = messages[-1]
+        if done["type"] != "done" or done["transcript"] != os.environ["ASR_FAKE_TRANSCRIPT"] or not interim:
+            print("❌ 流式识别结果不对：", messages)
+            return False
+        print(f"✅ 流式识别 OK：{len(interim)} 条中间结果，最终: {done['transcript']}")
+        return True
+    except Exception as e:
+        print("❌ 流式识别测试失败：", e)
+        return False
+
 def test_json_and_id():
     """检查 GCP 环境变量 + JSON 密钥 + 项目ID 是否匹配"""
     ok1 = GCSClient.test_gcp_credentials()
@@ -77,6 +221,10 @@ if __name__ == "__main__":
     parser.add_argument("--cohere", action="store_true", help="测试 Cohere 生成")
     parser.add_argument("--gcs", action="store_true", help="测试 GCS 上传/列表/签名URL")
     parser.add_argument("--gcpconf", action="store_true", help="测试 GCP 凭证与项目ID匹配")
+    parser.add_argument("--direct-upload", action="store_true", help="测试签名直传 + finalize 校验")
+    parser.add_argument("--stream-abort", action="store_true", help="测试流式上传中断后 bucket 里没有半截对象")
+    parser.add_argument("--asr-stream", action="store_true", help="用假识别器测试流式识别 WebSocket")
+    parser.add_argument("--startup", action="store_true", help="冷启动预算检查（超时或提前加载重依赖时退出码为 1）")
     args = parser.parse_args()
 
     ran = False
@@ -89,6 +237,20 @@ if __name__ == "__main__":
     if args.gcpconf:
         ran = True
         test_json_and_id()
+    if args.direct_upload:
+        ran = True
+        test_direct_upload()
+    if args.stream_abort:
+        ran = True
+        test_stream_abort()
+    if args.asr_stream:
+        ran = True
+        test_asr_stream()
+    if args.startup:
+        ran = True
+        # 给 CI 用：失败时返回非 0
+        if not test_startup():
+            sys.exit(1)
 
     if not ran:
         # 默认全部跑
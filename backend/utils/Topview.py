@@ -1,21 +1,41 @@
 import os
 import time
-import requests
 import datetime
-from typing import List
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
+from utils import topview_notices
+from utils.topview_client import topview_client
+from utils.audio_preprocess import audio_content_hash
+from utils.hashing import sha256_file
+from utils.sqlite_cache import SQLiteCache, cache_path
 
 load_dotenv()
 AUTH = os.getenv("TOPVIEW_AUTH")
 VIDEO_DIR = os.getenv("VIDEO_DIR", "./videos")
 UID  = os.getenv("TOPVIEW_UID")
-BASE = "https://api.topview.ai/v1"
+# Max avatar renders in flight on Topview at once for a single deck
+MAX_CONCURRENT_RENDERS = int(os.getenv("TOPVIEW_MAX_CONCURRENCY", "4"))
+# Public URL of /notice/topview. When set, completions arrive by callback and
+# polling drops to a slow fallback that only catches lost callbacks.
+NOTICE_URL = os.getenv("TOPVIEW_NOTICE_URL")
+FALLBACK_POLL_INTERVAL = float(os.getenv("TOPVIEW_FALLBACK_POLL_INTERVAL", "30"))
 
-def headers(json=True):
-    h = {"Authorization": f"Bearer {AUTH}", "Topview-Uid": UID}
-    if json:
-        h["Content-Type"] = "application/json"
-    return h
+# normalized audio hash -> cloned voiceId, so the same presenter is cloned once
+voice_clone_cache = SQLiteCache(
+    cache_path("topview.sqlite3"),
+    table="voice_clones",
+    ttl=float(os.getenv("VOICE_CLONE_CACHE_TTL", str(30 * 24 * 3600))),
+)
+# file content hash -> Topview fileId. Keep TOPVIEW_FILE_TTL below how long
+# Topview retains uploads; hits are also re-checked with /upload/check, so an
+# id Topview dropped early is re-uploaded instead of failing every render.
+uploaded_file_cache = SQLiteCache(
+    cache_path("topview.sqlite3"),
+    table="uploaded_files",
+    ttl=float(os.getenv("TOPVIEW_FILE_TTL", str(24 * 3600))),
+)
 
 MIME_TYPES = {
     "mp4": "video/mp4",
@@ -25,132 +45,266 @@ MIME_TYPES = {
     "m4a": "audio/mp4"
 }
 
+# Thin sync wrappers over the shared async client (utils/topview_client.py);
+# the batch flow runs in worker threads, async routes await the client directly.
+
 def get_upload_credential(file_format: str):
-    url = f"{BASE}/upload/credential?format={file_format}"
-    r = requests.get(url, headers=headers(json=False))
-    r.raise_for_status()
-    return r.json()["result"]
+    return topview_client.run(topview_client.get_upload_credential(file_format))
 
 def put_file(upload_url: str, file_path: str, content_type: str):
-    with open(file_path, "rb") as f:
-        r = requests.put(upload_url, headers={"Content-Type": content_type}, data=f)
-    r.raise_for_status()
+    topview_client.run(topview_client.put_file(upload_url, file_path, content_type))
 
 def check_upload(file_id: str, interval=1, max_retries=30) -> bool:
-    url = f"{BASE}/upload/check?fileId={file_id}"
-    for i in range(max_retries):
-        r = requests.get(url, headers=headers(json=False))
-        r.raise_for_status()
-        data = r.json()
-        if data.get("result") is True:
-            return True
-        time.sleep(interval)
-    return False
-
-def upload_file(file_path: str) -> str:
+    return topview_client.run(topview_client.check_upload(file_id, interval, max_retries))
+
+def _still_uploaded(file_id: str) -> bool:
+    """One /upload/check call: is a cached fileId still usable on Topview?"""
+    try:
+        return check_upload(file_id, interval=0, max_retries=1)
+    except Exception as e:
+        print(f"Upload check for {file_id} failed: {e}")
+        return False
+
+def upload_file(file_path: str, use_cache: bool = True) -> str:
     ext = os.path.splitext(file_path)[1].lstrip(".").lower()
     if ext not in MIME_TYPES:
         raise ValueError(f"Unsupported format: {ext}, allowed={list(MIME_TYPES)}")
-    cred = get_upload_credential(ext)
-    file_id = cred["fileId"]
-    put_file(cred["uploadUrl"], file_path, MIME_TYPES[ext])
-    if not check_upload(file_id):
-        raise TimeoutError("Upload not confirmed")
+
+    key = f"{ext}:{sha256_file(file_path)}"
+    if use_cache:
+        file_id = uploaded_file_cache.get(key)
+        if file_id and _still_uploaded(file_id):
+            print(f"Upload cache hit for {os.path.basename(file_path)}: {file_id}")
+            return file_id
+        if file_id:
+            # Topview dropped it before TOPVIEW_FILE_TTL ran out; upload again
+            print(f"Cached fileId {file_id} no longer on Topview, re-uploading {os.path.basename(file_path)}")
+            invalidate_uploaded_file(file_id)
+
+    file_id = topview_client.run(topview_client.upload(file_path, ext, MIME_TYPES[ext]))
+    uploaded_file_cache.set(key, file_id)
     return file_id
 
-def submit_voice_clone(origin_voice_file_id: str) -> str:
-    url = f"{BASE}/voice/clone/task/submit"
-    payload = {"originVoiceFileId": origin_voice_file_id, "voiceSpeed": "0.8"}
-    r = requests.post(url, headers=headers(), json=payload)
-    r.raise_for_status()
-    return r.json()["result"]["taskId"]
+def invalidate_uploaded_file(file_id: str | None = None) -> int:
+    """
+    Forget a cached fileId (e.g. Topview rejected it), or all of them
+    """
+    if file_id:
+        return uploaded_file_cache.delete_value(file_id)
+    return uploaded_file_cache.clear()
 
-def query_voice_clone(task_id: str, interval=3, max_tries=60) -> str:
-    url = f"{BASE}/voice/clone/task/query"
-    for i in range(max_tries):
-        r = requests.get(url, headers=headers(json=False), params={"taskId": task_id})
-        r.raise_for_status()
-        data = r.json()
-        result = data.get("result", {})
-        if result.get("status") == "success":
-            voice = result.get("voice") or {}
-            voice_id = voice.get("voiceId") or result.get("voiceId")
-            if voice_id:
-                return voice_id
+def _poll_task(task_id: str, fetch: Callable[[str], dict], interval, max_tries) -> dict:
+    """
+    Poll fetch(task_id) until the task succeeds or fails, or until
+    interval * max_tries seconds have passed. Returns the last result.
+
+    With NOTICE_URL configured we block on the callback instead and only
+    poll every FALLBACK_POLL_INTERVAL seconds in case it got lost.
+    """
+    waiter = topview_notices.expect(task_id) if NOTICE_URL else None
+    deadline = time.monotonic() + interval * max_tries
+    try:
+        while True:
+            result = fetch(task_id)
+            remaining = deadline - time.monotonic()
+            if result.get("status") in ("success", "failed") or remaining <= 0:
+                return result
+            if waiter is not None and not waiter.done():
+                wait([waiter], timeout=min(max(interval, FALLBACK_POLL_INTERVAL), remaining))
             else:
-                raise RuntimeError(f"Success but no voiceId: {result}")
-        if result.get("status") == "failed":
-            raise RuntimeError(f"Voice clone failed: {result}")
-        time.sleep(interval)
+                time.sleep(min(interval, remaining))
+    finally:
+        if waiter is not None:
+            topview_notices.discard(task_id)
+
+def submit_voice_clone(origin_voice_file_id: str, notice_url=NOTICE_URL) -> str:
+    return topview_client.run(topview_client.submit_voice_clone(origin_voice_file_id, notice_url))
+
+def get_voice_clone(task_id: str) -> dict:
+    return topview_client.run(topview_client.get_voice_clone(task_id))
+
+def query_voice_clone(task_id: str, interval=3, max_tries=60) -> str:
+    result = _poll_task(task_id, get_voice_clone, interval, max_tries)
+    if result.get("status") == "success":
+        voice = result.get("voice") or {}
+        voice_id = voice.get("voiceId") or result.get("voiceId")
+        if voice_id:
+            return voice_id
+        else:
+            raise RuntimeError(f"Success but no voiceId: {result}")
+    if result.get("status") == "failed":
+        raise RuntimeError(f"Voice clone failed: {result}")
     raise TimeoutError("Voice clone not finished")
 
-def _download_video(url: str, task_id: str | None = None) -> str:
+def clone_voice(audio_path: str, use_cache: bool = True) -> str:
+    """
+    Upload + clone a voice sample, reusing a previous clone of the same audio
+    """
+    key = audio_content_hash(audio_path)
+    if use_cache:
+        voice_id = voice_clone_cache.get(key)
+        if voice_id:
+            print(f"Voice clone cache hit: {voice_id}")
+            return voice_id
+
+    origin_file_id = upload_file(audio_path)
+    task_id = submit_voice_clone(origin_file_id)
+    voice_id = query_voice_clone(task_id)
+    voice_clone_cache.set(key, voice_id)
+    return voice_id
+
+def invalidate_voice_clone(voice_id: str | None = None, audio_path: str | None = None) -> int:
+    """
+    Forget cached clones: by voiceId, by audio sample, or all of them
+    """
+    if voice_id:
+        return voice_clone_cache.delete_value(voice_id)
+    if audio_path:
+        return int(voice_clone_cache.delete(audio_content_hash(audio_path)))
+    return voice_clone_cache.clear()
+
+def _video_path(task_id: str | None = None) -> str:
     name = f"result_{task_id}.mp4" if task_id else f"result_{int(datetime.datetime.utcnow().timestamp())}.mp4"
-    local_path = os.path.join(VIDEO_DIR, name)
-
-    with requests.get(url, stream=True, timeout=60) as resp:
-        resp.raise_for_status()
-        with open(local_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-    return local_path
-
-
-def submit_video_task(video_file_id: str, voice_id: str, tts_text: str, notice_url=None) -> str:
-    url = f"{BASE}/video_avatar/task/submit"
-    payload = {
-        "avatarSourceFrom": "0",
-        "videoFileId": video_file_id,
-        "audioSourceFrom": "1",
-        "ttsText": tts_text,
-        "voiceoverId": voice_id,
-        "modeType": "0"
-    }
-    if notice_url:
-        payload["noticeUrl"] = notice_url
-    r = requests.post(url, headers=headers(), json=payload)
-    r.raise_for_status()
-    return r.json()["result"]["taskId"]
+    return os.path.join(VIDEO_DIR, name)
+
+def _download_video(url: str, task_id: str | None = None) -> str:
+    return topview_client.run(topview_client.download(url, _video_path(task_id)))
+
+
+def submit_video_task(video_file_id: str, voice_id: str, tts_text: str, notice_url=NOTICE_URL) -> str:
+    return topview_client.run(topview_client.submit_video_task(video_file_id, voice_id, tts_text, notice_url))
+
+def get_video_task(task_id: str) -> dict:
+    return topview_client.run(topview_client.get_video_task(task_id))
 
 def query_video_task(task_id: str, interval=5, max_tries=120) -> str:
-    url = f"{BASE}/video_avatar/task/query"
-    for i in range(max_tries):
-        r = requests.get(url, headers=headers(json=False),
-                         params={"taskId": task_id, "needCloudFrontUrl": "true"})
-        r.raise_for_status()
-        data = r.json()
-        result = data.get("result", {})
-        if result.get("status") == "success":
-            video_url = result.get("outputVideoUrl")
-            return _download_video(video_url, task_id)
-        if result.get("status") == "failed":
-            raise RuntimeError(f"Video task failed: {result}")
-        time.sleep(interval)
+    result = _poll_task(task_id, get_video_task, interval, max_tries)
+    if result.get("status") == "success":
+        video_url = result.get("outputVideoUrl")
+        return _download_video(video_url, task_id)
+    if result.get("status") == "failed":
+        raise RuntimeError(f"Video task failed: {result}")
     raise TimeoutError("Video task not finished")
 
-def gen_video(audio_path: str, video_path: str, tts_text: str):
-    origin_file_id = upload_file(audio_path)
+def render_videos(video_file_id: str, voice_id: str, tts_text: List[str],
+                  max_concurrency: int | None = None, interval=5, max_tries=120,
+                  on_video: Optional[Callable[[int, str], None]] = None) -> List[str]:
+    """
+    Render one avatar video per text concurrently.
 
-    task_id = submit_voice_clone(origin_file_id)
-    voice_id = query_voice_clone(task_id)
+    Up to max_concurrency tasks are kept in flight on Topview and polled
+    together each round; finished videos are downloaded in the background
+    while the freed slot is refilled. The returned paths follow tts_text order.
+    """
+    max_concurrency = max(1, max_concurrency or MAX_CONCURRENT_RENDERS)
+    fallback_interval = max(interval, FALLBACK_POLL_INTERVAL)
+    pending = deque(enumerate(tts_text))
+    in_flight = {}  # task_id -> {"index", "deadline", "polled", "waiter"}
+    downloads = []
+    video_paths: List[Optional[str]] = [None] * len(tts_text)
+
+    def _download(index, video_url, task_id):
+        path = _download_video(video_url, task_id)
+        video_paths[index] = path
+        print(f"Downloaded video {index + 1}/{len(tts_text)}: {path}")
+        if on_video:
+            on_video(index, path)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < max_concurrency:
+                    index, text = pending.popleft()
+                    task_id = submit_video_task(video_file_id, voice_id, text)
+                    now = time.monotonic()
+                    in_flight[task_id] = {
+                        "index": index,
+                        "deadline": now + interval * max_tries,
+                        "polled": now,
+                        "waiter": topview_notices.expect(task_id) if NOTICE_URL else None,
+                    }
+                    print(f"Submitted video {index + 1}/{len(tts_text)}: task {task_id}")
+
+                # Sleep until a callback lands; tasks without a live waiter
+                # (no NOTICE_URL, or a notice that came too early) poll at the normal pace
+                open_waiters = [t["waiter"] for t in in_flight.values() if t["waiter"] and not t["waiter"].done()]
+                if len(open_waiters) == len(in_flight):
+                    wait(open_waiters, timeout=fallback_interval, return_when=FIRST_COMPLETED)
+                elif open_waiters:
+                    wait(open_waiters, timeout=interval, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(interval)
+
+                now = time.monotonic()
+                for task_id in list(in_flight):
+                    task = in_flight[task_id]
+                    waiter = task["waiter"]
+                    if waiter is not None:
+                        if not waiter.done() and now - task["polled"] < fallback_interval:
+                            continue
+                        if waiter.done():
+                            topview_notices.discard(task_id)
+                            task["waiter"] = None
+                    task["polled"] = now
+                    index = task["index"]
+                    result = get_video_task(task_id)
+                    status = result.get("status")
+                    if status == "success":
+                        del in_flight[task_id]
+                        if task["waiter"] is not None:
+                            topview_notices.discard(task_id)
+                        downloads.append(pool.submit(_download, index, result.get("outputVideoUrl"), task_id))
+                    elif status == "failed":
+                        raise RuntimeError(f"Video task failed for slide {index + 1}: {result}")
+                    elif now >= task["deadline"]:
+                        raise TimeoutError(f"Video task not finished for slide {index + 1}")
+        finally:
+            for task_id, task in in_flight.items():
+                if task["waiter"] is not None:
+                    topview_notices.discard(task_id)
+            # Surface download errors (and wait for in-progress ones on failure)
+            for future in downloads:
+                future.result()
+
+    return video_paths
+
+def gen_video(audio_path: str, video_path: str, tts_text: str):
+    voice_id = clone_voice(audio_path)
 
     video_file_id = upload_file(video_path)
     
-    video_task_id = submit_video_task(video_file_id, voice_id, tts_text,
-                                      notice_url="https://410534426f02.ngrok-free.app/notice/topview")
+    video_task_id = submit_video_task(video_file_id, voice_id, tts_text)
     output_url = query_video_task(video_task_id)
 
+async def render_answer_video(video_file_id: str, voice_id: str, tts_text: str,
+                              interval=5, max_tries=120) -> str:
+    """
+    Async answer flow: submit one avatar video, wait for it and download it,
+    without tying up a thread while Topview renders.
+    """
+    task_id = await topview_client.submit_video_task(video_file_id, voice_id, tts_text, NOTICE_URL)
+    result = await topview_client.poll(task_id, topview_client.get_video_task, interval, max_tries,
+                                       notice=bool(NOTICE_URL), fallback_interval=FALLBACK_POLL_INTERVAL)
+    if result.get("status") == "success":
+        return await topview_client.download(result.get("outputVideoUrl"), _video_path(task_id))
+    if result.get("status") == "failed":
+        raise RuntimeError(f"Video task failed: {result}")
+    raise TimeoutError("Video task not finished")
+
 def gen_video_answer(video_file_id, voice_id, tts_text):
-    video_task_id = submit_video_task(video_file_id, voice_id, tts_text,
-                                      notice_url="https://410534426f02.ngrok-free.app/notice/topview")
-    output_url = query_video_task(video_task_id)
-    return output_url
+    return topview_client.run(render_answer_video(video_file_id, voice_id, tts_text))
 
-def gen_video_batch(audio_path: str, video_path: str, tts_text: List[str]):
+def gen_video_batch(audio_path: str, video_path: str, tts_text: List[str],
+                    on_stage: Optional[Callable[[str, str], None]] = None,
+                    on_video: Optional[Callable[[int, str], None]] = None):
     """
     Generate videos and return IDs - supports both demo and production modes
+
+    on_stage(stage, "start" | "done") and on_video(index, path) are optional
+    progress hooks, used by the job API to report progress while rendering.
     """
+    on_stage = on_stage or (lambda stage, status: None)
+    on_video = on_video or (lambda index, path: None)
     import os
     DEMO_MODE = os.getenv('DEMO_MODE', 'false').lower() == 'true'
     
@@ -169,6 +323,11 @@ def gen_video_batch(audio_path: str, video_path: str, tts_text: List[str]):
         print(f"DEMO MODE: Generated dummy voice_id: {dummy_voice_id}")
         print(f"DEMO MODE: Generated dummy video_file_id: {dummy_video_file_id}")
         
+        for stage in ("voice_clone", "face_upload"):
+            on_stage(stage, "start")
+            on_stage(stage, "done")
+        on_stage("videos", "start")
+
         # Return the appropriate number of videos based on the number of scripts
         out = []
         for i, text in enumerate(tts_text):
@@ -181,7 +340,9 @@ def gen_video_batch(audio_path: str, video_path: str, tts_text: List[str]):
                 video_path = hardcoded_videos[i % len(hardcoded_videos)]
                 print(f"DEMO MODE: Cycling video for script {i+1}: {video_path} for script: {text[:50]}...")
                 out.append(video_path)
+            on_video(i, video_path)
         
+        on_stage("videos", "done")
         print(f"DEMO MODE: Returning {len(out)} hardcoded video paths")
         return {
             "video_urls": out,
@@ -194,31 +355,24 @@ def gen_video_batch(audio_path: str, video_path: str, tts_text: List[str]):
         
         # Step 1: Upload voice file and get voice_id
         print("PRODUCTION MODE: Uploading voice file and cloning voice...")
-        origin_file_id = upload_file(audio_path)
-        task_id = submit_voice_clone(origin_file_id)
-        voice_id = query_voice_clone(task_id)
+        on_stage("voice_clone", "start")
+        voice_id = clone_voice(audio_path)
+        on_stage("voice_clone", "done")
         print(f"PRODUCTION MODE: Generated voice_id: {voice_id}")
         
         # Step 2: Upload video file and get video_file_id
         print("PRODUCTION MODE: Uploading video file...")
+        on_stage("face_upload", "start")
         video_file_id = upload_file(video_path)
+        on_stage("face_upload", "done")
         print(f"PRODUCTION MODE: Generated video_file_id: {video_file_id}")
         
         # Step 3: Generate videos for each script
         print("PRODUCTION MODE: Generating videos for each script...")
-        video_urls = []
-        for i, text in enumerate(tts_text):
-            print(f"PRODUCTION MODE: Generating video {i+1}/{len(tts_text)} for script: {text[:50]}...")
-            
-            # Submit video task
-            video_task_id = submit_video_task(video_file_id, voice_id, text)
-            
-            # Query video task and get result
-            output_path = query_video_task(video_task_id)
-            video_urls.append(output_path)
-            
-            print(f"PRODUCTION MODE: Generated video {i+1}: {output_path}")
+        on_stage("videos", "start")
+        video_urls = render_videos(video_file_id, voice_id, tts_text, on_video=on_video)
         
+        on_stage("videos", "done")
         print(f"PRODUCTION MODE: Generated {len(video_urls)} real videos")
         return {
             "video_urls": video_urls,
@@ -1,15 +1,55 @@
 import os
 import io
+import hashlib
 import uuid
+import shutil
 import numpy as np
-import soundfile as sf
-import librosa
 import tempfile
+from utils.hashing import sha256_file
 
-def to_linear16_wav_file(src_path: str, target_sr: int = 16000) -> str:
+# 流式转码每块的帧数（48k 下约 5 秒），内存占用和录音长度无关
+STREAM_BLOCK_FRAMES = int(os.getenv("AUDIO_STREAM_BLOCK_FRAMES", str(1 << 18)))
+
+def _to_int16(y: np.ndarray) -> np.ndarray:
+    return np.clip(y * 32767.0, -32768, 32767).astype(np.int16)
+
+def _is_linear16(info, target_sr: int) -> bool:
+    return info.format == "WAV" and info.subtype == "PCM_16" and info.channels == 1 and info.samplerate == target_sr
+
+def _stream_convert(src_path: str, out, info, target_sr: int, block_frames: int, normalize: bool = True):
     """
-    把任意常见音频转成16k PCM16 WAV，返回临时文件路径。
+    libsndfile 能直接读的格式（wav/flac/ogg/mp3）：分块解码 -> 单声道 -> soxr 流式重采样 -> PCM16。
+    峰值归一化需要先知道全局峰值，所以先扫一遍只算峰值，再扫一遍写出（normalize=False 时只扫一遍）。
     """
+    import soundfile as sf
+    import soxr
+
+    gain = 1.0
+    if normalize:
+        peak = 0.0
+        for block in sf.blocks(src_path, blocksize=block_frames, dtype="float32", always_2d=True):
+            if len(block):
+                peak = max(peak, float(np.max(np.abs(block.mean(axis=1)))))
+        gain = 0.99 / (peak + 1e-9)
+
+    resampler = None
+    if info.samplerate != target_sr:
+        resampler = soxr.ResampleStream(info.samplerate, target_sr, 1, dtype="float32")
+
+    with sf.SoundFile(out, mode="w", samplerate=target_sr, channels=1, subtype="PCM_16", format="WAV") as dst:
+        for block in sf.blocks(src_path, blocksize=block_frames, dtype="float32", always_2d=True):
+            y = block.mean(axis=1)
+            if resampler is not None:
+                y = resampler.resample_chunk(y)
+            dst.write(_to_int16(y * gain))
+        if resampler is not None:
+            dst.write(_to_int16(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True) * gain))
+
+def _librosa_convert(src_path: str, out, target_sr: int, normalize: bool = True):
+    """libsndfile 读不了的格式（m4a/webm 等）走 librosa/audioread，整段解码"""
+    import librosa
+    import soundfile as sf
+
     y, sr = librosa.load(src_path, sr=None, mono=False)
 
     # 转单声道
@@ -21,18 +61,219 @@ def to_linear16_wav_file(src_path: str, target_sr: int = 16000) -> str:
 
     if sr != target_sr:
         y = librosa.resample(y.astype(np.float32), orig_sr=sr, target_sr=target_sr)
-        sr = target_sr
 
-    peak = float(np.max(np.abs(y)) + 1e-9)
-    y = (y / peak) * 0.99
-    y_i16 = (y * 32767.0).astype(np.int16)
+    if normalize:
+        peak = float(np.max(np.abs(y)) + 1e-9)
+        y = (y / peak) * 0.99
+    sf.write(out, _to_int16(y), target_sr, subtype="PCM_16", format="WAV")
 
-    tmp_path = os.path.join(tempfile.gettempdir(), f"lin16_{uuid.uuid4().hex}.wav")
-    sf.write(tmp_path, y_i16, sr, subtype="PCM_16")
+def write_linear16_wav(src_path: str, out, target_sr: int = 16000, fast_path: bool = True,
+                       block_frames: int = STREAM_BLOCK_FRAMES, normalize: bool = True):
+    """
+    把 src_path 转成单声道 target_sr PCM16 WAV，写到 out（路径或可写的 file-like）。
+    已经是 mono/target_sr/PCM16 的 WAV 直接原样拷贝（fast_path），不解码也不归一化。
+    normalize=False 保留原始电平（VAD 要用绝对 dBFS，不能先把底噪放大到满幅）。
+    """
+    # soundfile/soxr/librosa 很重（libsndfile、numba），第一次转码时才加载
+    import soundfile as sf
 
-    with sf.SoundFile(tmp_path) as f:
-        ch, rate = f.channels, f.samplerate
-    if ch != 1 or rate != target_sr:
-        raise RuntimeError(f"Conversion failed: channels={ch}, sample_rate={rate}, expect mono/{target_sr}")
+    try:
+        info = sf.info(src_path)
+    except Exception:
+        info = None
 
+    if info is not None and fast_path and _is_linear16(info, target_sr):
+        if isinstance(out, str):
+            shutil.copyfile(src_path, out)
+        else:
+            with open(src_path, "rb") as f:
+                shutil.copyfileobj(f, out)
+        return
+    if info is not None:
+        _stream_convert(src_path, out, info, target_sr, block_frames, normalize=normalize)
+    else:
+        _librosa_convert(src_path, out, target_sr, normalize=normalize)
+
+def to_linear16_wav_bytes(src_path: str, target_sr: int = 16000, fast_path: bool = True,
+                          normalize: bool = True) -> io.BytesIO:
+    """
+    同 to_linear16_wav_file，但结果在内存里（BytesIO，已 seek 到开头），
+    ASR 之类直接要字节的调用方不用再落盘、再读回来。
+    """
+    buf = io.BytesIO()
+    write_linear16_wav(src_path, buf, target_sr=target_sr, fast_path=fast_path, normalize=normalize)
+    buf.seek(0)
+    return buf
+
+def to_linear16_wav_file(src_path: str, target_sr: int = 16000) -> str:
+    """
+    把任意常见音频转成16k PCM16 WAV，返回临时文件路径（调用方负责删除）。
+    """
+    tmp_path = os.path.join(tempfile.gettempdir(), f"lin16_{uuid.uuid4().hex}.wav")
+    try:
+        write_linear16_wav(src_path, tmp_path, target_sr=target_sr)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
     return tmp_path
+
+def audio_content_hash(src_path: str, target_sr: int = 16000) -> str:
+    """
+    对归一化后的 PCM 求 sha256：同一段录音换了容器/码率也能命中同一个 key。
+    解码失败时退回到原始文件字节的哈希。
+    """
+    h = hashlib.sha256()
+    try:
+        # 不走 fast path：已经是 16k PCM16 的文件也要归一化，否则同一段录音会得到不同的 key
+        wav = to_linear16_wav_bytes(src_path, target_sr=target_sr, fast_path=False)
+    except Exception as e:
+        print(f"audio_content_hash: decode failed ({e}), hashing raw bytes")
+        return f"raw:{sha256_file(src_path)}"
+    import soundfile as sf
+    data, _ = sf.read(wav, dtype="int16")
+    h.update(data.tobytes())
+    return f"pcm16:{target_sr}:{h.hexdigest()}"
+
+# ---- 能量 VAD（纯 NumPy 向量化，按帧算 RMS） ----
+
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+# 帧能量比噪声底（最安静的 10% 帧）高出这么多 dB 才算有人声
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# 绝对下限：低于这个 dBFS 的帧一律当静音
+VAD_FLOOR_DB = float(os.getenv("VAD_FLOOR_DB", "-55"))
+# 裁剪时人声前后各保留多少静音，免得把第一个/最后一个字的起音切掉
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", "200"))
+# 响亮帧（p90）比噪声底（p10）至少高出这么多 dB，才允许用"响亮帧 - margin"压低阈值；
+# 能量平坦的录音（持续的底噪、风扇声）不会因此整段被当成人声
+VAD_MIN_RANGE_DB = float(os.getenv("VAD_MIN_RANGE_DB", "6"))
+# 有声帧总时长少于这个就当整段都是静音（咳嗽、点击声之类）
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))
+# 能裁掉的静音少于这个就不重新编码，原文件直接发
+VAD_MIN_TRIM_MS = int(os.getenv("VAD_MIN_TRIM_MS", "500"))
+
+def read_linear16(src_path: str, target_sr: int = 16000, normalize: bool = True) -> np.ndarray:
+    """解码成单声道 target_sr 的 int16 数组（内存里转码，不落盘）；VAD 用 normalize=False"""
+    import soundfile as sf
+    wav = to_linear16_wav_bytes(src_path, target_sr=target_sr, normalize=normalize)
+    data, _ = sf.read(wav, dtype="int16")
+    return data
+
+def frame_energy_db(y: np.ndarray, sr: int, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """每帧的 RMS 能量（dBFS），最后不满一帧的部分丢掉"""
+    n = max(1, int(sr * frame_ms / 1000))
+    frames = len(y) // n
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    x = y[:frames * n].astype(np.float32).reshape(frames, n) / 32768.0
+    return 10.0 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+
+def voiced_frames(y: np.ndarray, sr: int, frame_ms: int = VAD_FRAME_MS,
+                  margin_db: float = VAD_MARGIN_DB, floor_db: float = VAD_FLOOR_DB,
+                  min_range_db: float = VAD_MIN_RANGE_DB) -> np.ndarray:
+    """
+    布尔数组：每帧是否有声音。阈值跟着录音的噪声底走，所以不用按麦克风调参。
+    y 要是原始电平（没有峰值归一化），floor_db 才是真正的绝对下限。
+    """
+    db = frame_energy_db(y, sr, frame_ms)
+    if len(db) == 0:
+        return np.zeros(0, dtype=bool)
+    low, high = np.percentile(db, [10, 90])
+    threshold = float(low) + margin_db
+    # 几乎没有停顿的录音里"噪声底"其实是人声，所以阈值不超过响亮帧 - margin；
+    # 但能量平坦（high - low 太小）说明根本没有起伏，那就是底噪，不压低阈值
+    if high - low >= min_range_db:
+        threshold = min(threshold, float(high) - margin_db)
+    return db > max(floor_db, threshold)
+
+def _silent_runs(voiced: np.ndarray):
+    """(start, end) frame indices of every run of silent frames, end exclusive."""
+    edges = np.diff(np.concatenate(([0], (~voiced).astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def split_on_silence(y: np.ndarray, sr: int, max_chunk_s: float = 50.0, min_silence_ms: int = 300,
+                     frame_ms: int = VAD_FRAME_MS) -> list:
+    """
+    把长录音切成 <= max_chunk_s 的段，尽量切在静音中间，避免把一个词切成两半。
+    找不到足够长的静音时在 max_chunk_s 处硬切。全是静音的段会被丢掉。
+    返回 [(start_sample, end_sample), ...]。
+    """
+    n = max(1, int(sr * frame_ms / 1000))
+    voiced = voiced_frames(y, sr, frame_ms)
+    if not voiced.any():
+        return []
+    starts, ends = _silent_runs(voiced)
+    long_enough = (ends - starts) * frame_ms >= min_silence_ms
+    # 候选切点：够长的静音段的中点（换算成采样点）
+    cuts = ((starts[long_enough] + ends[long_enough]) // 2) * n
+    max_len = int(max_chunk_s * sr)
+
+    bounds = []
+    pos = 0
+    while pos < len(y):
+        limit = pos + max_len
+        if limit >= len(y):
+            end = len(y)
+        else:
+            # 最后一个落在 (pos, limit] 里的切点
+            i = np.searchsorted(cuts, limit, side="right") - 1
+            end = int(cuts[i]) if i >= 0 and cuts[i] > pos else limit
+        bounds.append((pos, end))
+        pos = end
+
+    # 丢掉没有人声的段
+    frame_voiced = np.concatenate((voiced, [False]))
+    return [(s, e) for s, e in bounds if frame_voiced[s // n:max(s // n + 1, e // n)].any()]
+
+def pcm16_wav_bytes(y: np.ndarray, sr: int) -> bytes:
+    import soundfile as sf
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, subtype="PCM_16", format="WAV")
+    return buf.getvalue()
+
+def speech_bounds(y: np.ndarray, sr: int, pad_ms: int = VAD_PAD_MS, min_speech_ms: int = VAD_MIN_SPEECH_MS,
+                  frame_ms: int = VAD_FRAME_MS, margin_db: float = VAD_MARGIN_DB,
+                  floor_db: float = VAD_FLOOR_DB, min_range_db: float = VAD_MIN_RANGE_DB):
+    """
+    第一帧到最后一帧人声的采样区间（两头各加 pad_ms），录音里有声帧不足
+    min_speech_ms 时返回 None。
+    """
+    voiced = voiced_frames(y, sr, frame_ms, margin_db, floor_db, min_range_db)
+    if voiced.sum() * frame_ms < min_speech_ms:
+        return None
+    n = max(1, int(sr * frame_ms / 1000))
+    idx = np.flatnonzero(voiced)
+    pad = int(sr * pad_ms / 1000)
+    return max(0, int(idx[0]) * n - pad), min(len(y), (int(idx[-1]) + 1) * n + pad)
+
+def prepare_for_asr(src_path: str, target_sr: int = 16000, force_wav: bool = False,
+                    min_trim_ms: int = VAD_MIN_TRIM_MS) -> dict:
+    """
+    ASR 之前的 VAD 门控 + 首尾静音裁剪。
+    返回 {"has_speech", "path", "trimmed", "duration_s", "speech_s"}：
+    - 整段都是静音：has_speech=False，调用方直接跳过 ASR（以及后面的 Cohere/Topview）
+    - 能裁掉至少 min_trim_ms 的静音（或 force_wav）：path 是裁好的 16k PCM16 WAV 临时文件，调用方负责删除
+    - 否则 path 就是原文件，原样发送，不重新编码
+    解码失败时不拦截，原文件照发。
+    """
+    try:
+        # 不归一化：归一化会把安静录音的底噪放大到满幅，VAD_FLOOR_DB 就失效了
+        y = read_linear16(src_path, target_sr=target_sr, normalize=False)
+    except Exception as e:
+        print(f"prepare_for_asr: decode failed ({e}), sending audio untrimmed")
+        return {"has_speech": True, "path": src_path, "trimmed": False, "duration_s": None, "speech_s": None}
+
+    duration_s = round(len(y) / target_sr, 2)
+    bounds = speech_bounds(y, target_sr)
+    if bounds is None:
+        return {"has_speech": False, "path": None, "trimmed": False, "duration_s": duration_s, "speech_s": 0.0}
+
+    start, end = bounds
+    speech_s = round((end - start) / target_sr, 2)
+    if not force_wav and (len(y) - (end - start)) * 1000 / target_sr < min_trim_ms:
+        return {"has_speech": True, "path": src_path, "trimmed": False, "duration_s": duration_s, "speech_s": speech_s}
+
+    out_path = os.path.join(tempfile.gettempdir(), f"lin16_{uuid.uuid4().hex}.wav")
+    with open(out_path, "wb") as f:
+        f.write(pcm16_wav_bytes(y[start:end], target_sr))
+    return {"has_speech": True, "path": out_path, "trimmed": True, "duration_s": duration_s, "speech_s": speech_s}
@@ -1,27 +1,159 @@
 import os
 import json
-from google.cloud import storage
+import hashlib
+import datetime
+import threading
+import time
+from urllib.parse import quote
 from google.oauth2 import service_account
 from google.auth.exceptions import DefaultCredentialsError, TransportError
 
+# 每个 worker 进程共用一个 storage.Client（连接池大小见 GCS_POOL_SIZE）
+GCS_POOL_SIZE = int(os.getenv("GCS_POOL_SIZE", "32"))
+GCS_SCOPES = ["https://www.googleapis.com/auth/devstorage.full_control"]
+
+_registry_lock = threading.Lock()
+_storage_client = None
+_gcs_clients = {}
+
+def _build_storage_client():
+    from google.cloud import storage
+
+    if os.getenv("STORAGE_EMULATOR_HOST"):
+        # 模拟器：库自己会用匿名凭证
+        return storage.Client()
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    try:
+        credentials, project = google.auth.default(scopes=GCS_SCOPES)
+    except DefaultCredentialsError:
+        raise Exception("GCP认证失败。请设置GOOGLE_APPLICATION_CREDENTIALS环境变量")
+    # 默认连接池只有 10 个连接，并发上传/下载时会排队
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return storage.Client(project=os.getenv("GCP_PROJECT_ID") or project,
+                          credentials=credentials, _http=session)
+
+def get_storage_client():
+    """进程内共享的 storage.Client，第一次用到时才创建（不在 import / 启动时联网）"""
+    global _storage_client
+    if _storage_client is None:
+        with _registry_lock:
+            if _storage_client is None:
+                _storage_client = _build_storage_client()
+    return _storage_client
+
+def get_gcs(bucket_name=None):
+    """按 bucket 缓存的 GCSClient，所有路由/服务共用"""
+    bucket_name = bucket_name or os.getenv("GCS_BUCKET")
+    gcs = _gcs_clients.get(bucket_name)
+    if gcs is None:
+        with _registry_lock:
+            gcs = _gcs_clients.get(bucket_name)
+            if gcs is None:
+                gcs = GCSClient(bucket_name)
+                _gcs_clients[bucket_name] = gcs
+    return gcs
+
+# resumable upload 的分块必须是 256 KiB 的整数倍（最后一块除外）
+RESUMABLE_CHUNK_UNIT = 256 * 1024
+RESUMABLE_TIMEOUT = float(os.getenv("GCS_RESUMABLE_TIMEOUT", "120"))
+
+class ResumableWriter:
+    """
+    自己驱动的 resumable upload：write() 攒满一块就发，close() 发最后一块并提交对象，
+    abort() 取消 session。不 close 就永远不会提交（对象被回收也不会），
+    所以中途失败不会在 bucket 里留下/覆盖成半截文件。
+    """
+
+    def __init__(self, http, session_url, chunk_size=8 * 1024 * 1024):
+        self._http = http
+        self.session_url = session_url
+        self.chunk_size = max(RESUMABLE_CHUNK_UNIT, chunk_size - chunk_size % RESUMABLE_CHUNK_UNIT)
+        self._buffer = bytearray()
+        self._offset = 0
+        self.closed = False
+
+    def _put(self, data, final):
+        if data:
+            total = str(self._offset + len(data)) if final else "*"
+            content_range = f"bytes {self._offset}-{self._offset + len(data) - 1}/{total}"
+        else:
+            content_range = f"bytes */{self._offset}"
+        resp = self._http.put(self.session_url, data=bytes(data),
+                              headers={"Content-Range": content_range}, timeout=RESUMABLE_TIMEOUT)
+        if final and resp.status_code not in (200, 201):
+            raise Exception(f"Resumable upload commit failed: {resp.status_code} {resp.text[:200]}")
+        if not final:
+            if resp.status_code != 308:
+                raise Exception(f"Resumable upload chunk failed: {resp.status_code} {resp.text[:200]}")
+            # 308 的 Range 头是服务端已持久化的字节范围，少了就说明这块没写全
+            persisted = resp.headers.get("Range")
+            if persisted and int(persisted.rsplit("-", 1)[-1]) + 1 != self._offset + len(data):
+                raise Exception(f"Resumable upload out of sync: server has {persisted}")
+        self._offset += len(data)
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed ResumableWriter")
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._put(self._buffer[:self.chunk_size], final=False)
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def close(self):
+        """发送剩下的数据并提交对象"""
+        if self.closed:
+            return
+        self._put(self._buffer, final=True)
+        self._buffer.clear()
+        self.closed = True
+
+    def abort(self):
+        """取消 session（GCS 返回 499），已传的分块作废，bucket 里原来的对象不受影响"""
+        if self.closed:
+            return
+        self.closed = True
+        self._buffer.clear()
+        try:
+            self._http.delete(self.session_url, timeout=RESUMABLE_TIMEOUT)
+        except Exception as e:
+            # session 一周后也会自己过期，取消失败不影响结果
+            print(f"⚠️  取消 resumable upload 失败: {e}")
+
 class GCSClient:
-    def __init__(self, bucket_name=None):
+    def __init__(self, bucket_name=None, client=None):
         # 如果没传 bucket_name，就从环境变量读取
         self.bucket_name = bucket_name or os.getenv("GCS_BUCKET")
         if not self.bucket_name:
             raise ValueError("GCS_BUCKET environment variable is required")
-        
-        try:
-            # 初始化客户端
-            self.client = storage.Client()
-            self.bucket = self.client.bucket(self.bucket_name)
-            # 检查bucket是否存在
-            if not self.bucket.exists():
-                raise ValueError(f"Bucket {self.bucket_name} does not exist")
-            print(f"✅ GCS客户端初始化成功，使用存储桶: {self.bucket_name}")
-            
-        except DefaultCredentialsError:
-            raise Exception("GCP认证失败。请设置GOOGLE_APPLICATION_CREDENTIALS环境变量")
+        # 不在构造函数里联网；bucket 是否存在由 verify()（/health/gcs）检查
+        self._client = client
+        self._bucket = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_storage_client()
+        return self._client
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = self.client.bucket(self.bucket_name)
+        return self._bucket
+
+    def verify(self):
+        """检查凭证和 bucket 是否可用，返回耗时，给健康检查用"""
+        start = time.monotonic()
+        if not self.bucket.exists():
+            raise ValueError(f"Bucket {self.bucket_name} does not exist")
+        return {"bucket": self.bucket_name, "latency_ms": round((time.monotonic() - start) * 1000, 1)}
 
     def upload_file(self, local_path, dest_path):
         """上传文件到 GCS"""
@@ -42,11 +174,72 @@ class GCSClient:
         blob.download_to_filename(local_path)
         print(f"✅ 文件下载成功: {local_path}")
 
-    def generate_signed_url(self, blob_name, expiration=3600):
-        """生成带签名的 URL，默认 1 小时有效"""
+    def download_bytes(self, blob_name):
+        """下载为内存中的 bytes（小文件用，例如 JSON 元数据）"""
+        return self.bucket.blob(blob_name).download_as_bytes()
+
+    def upload_bytes(self, data, dest_path, content_type="application/octet-stream"):
+        """把内存中的 bytes 直接上传到 GCS"""
+        blob = self.bucket.blob(dest_path)
+        blob.upload_from_string(data, content_type=content_type)
+        return f"gs://{self.bucket_name}/{dest_path}"
+
+    def open_writer(self, dest_path, content_type="application/octet-stream", chunk_size=8 * 1024 * 1024):
+        """
+        以 resumable upload 方式写入 GCS 的 ResumableWriter，内存里最多缓冲 chunk_size。
+        只有 close() 才会提交对象；中途出错要调 abort()，半截文件不会出现在 bucket 里。
+        （不用 blob.open("wb")：BlobWriter 被回收时会自动 close()，把半截文件提交上去）
+        """
+        session_url = self.create_upload_session(dest_path, content_type)
+        return ResumableWriter(self.client._http, session_url, chunk_size)
+
+    def generate_upload_url(self, dest_path, content_type, expiration=900, metadata=None):
+        """
+        V4 签名的 PUT URL：只能往 dest_path 写，且请求必须带同样的 Content-Type。
+        metadata 会变成签进 URL 的 x-goog-meta-* 头，上传时必须原样带上。
+        需要能签名的凭证（service account），模拟器下不可用。
+        """
+        blob = self.bucket.blob(dest_path)
+        headers = {f"x-goog-meta-{k}": v for k, v in (metadata or {}).items()}
+        return blob.generate_signed_url(
+            version="v4",
+            method="PUT",
+            content_type=content_type,
+            headers=headers or None,
+            expiration=datetime.timedelta(seconds=expiration),
+        )
+
+    def create_upload_session(self, dest_path, content_type, size=None, origin=None, metadata=None):
+        """创建 resumable upload session，返回的 session URL 本身就是写这个对象的凭据"""
+        blob = self.bucket.blob(dest_path)
+        if metadata:
+            # 写进 session 的初始请求，对象提交时就带着这些 metadata
+            blob.metadata = metadata
+        return blob.create_resumable_upload_session(content_type=content_type, size=size, origin=origin)
+
+    def sha256_blob(self, blob_name, chunk_size=8 * 1024 * 1024):
+        """边下载边算 sha256，不落盘"""
+        h = hashlib.sha256()
+        with self.bucket.blob(blob_name).open("rb", chunk_size=chunk_size) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def get_blob(self, blob_name):
+        """读取对象元数据（generation、size、md5 等），不存在时返回 None"""
+        return self.bucket.get_blob(blob_name)
+
+    def generate_signed_url(self, blob_name, expiration=3600, check_exists=True):
+        """生成带签名的 URL，默认 1 小时有效；刚上传完的对象可以传 check_exists=False 省一次请求"""
         blob = self.bucket.blob(blob_name)
-        if not blob.exists():
+        if check_exists and not blob.exists():
             raise ValueError(f"文件不存在: {blob_name}")
+        emulator = os.getenv("STORAGE_EMULATOR_HOST")
+        if emulator:
+            # 模拟器没有签名密钥，直接给下载地址
+            if not emulator.startswith("http"):
+                emulator = f"http://{emulator}"
+            return f"{emulator.rstrip('/')}/download/storage/v1/b/{self.bucket_name}/o/{quote(blob_name, safe='')}?alt=media"
         url = blob.generate_signed_url(expiration=expiration)
         return url
 
@@ -111,6 +304,7 @@ class GCSClient:
             )
             
             # 初始化存储客户端
+            from google.cloud import storage
             client = storage.Client(credentials=credentials, project=os.getenv('GCP_PROJECT_ID'))
             
             # 测试列出存储桶（简单权限测试）
@@ -0,0 +1,9 @@
+import hashlib
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Stream a file through sha256 without loading it into memory."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
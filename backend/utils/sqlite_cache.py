@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BACKEND_DIR, ".cache"))
+
+class SQLiteCache:
+    """
+    Small durable key/value cache on local disk.
+
+    Values are stored as JSON with an optional per-entry expiry; expired
+    rows read as missing and are cleaned up lazily.
+    """
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                        "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                        "created_at REAL NOT NULL, expires_at REAL)"
+                    )
+                    conn.commit()
+                    self._ready = True
+        return conn
+
+    def get(self, key: str, with_expiry: bool = False) -> Optional[Any]:
+        """Value for key, or None. with_expiry=True returns (value, expires_at) instead."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            value = json.loads(value)
+            return (value, expires_at) if with_expiry else value
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, expires_at),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, key: str) -> bool:
+        conn = self._connect()
+        try:
+            cur = conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.commit()
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+    def delete_value(self, value: Any) -> int:
+        """Drop every entry that maps to value (e.g. a revoked remote id)."""
+        conn = self._connect()
+        try:
+            cur = conn.execute(f"DELETE FROM {self.table} WHERE value = ?", (json.dumps(value),))
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def clear(self) -> int:
+        conn = self._connect()
+        try:
+            cur = conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def purge_expired(self) -> int:
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+
+def cache_path(name: str) -> str:
+    """Path of a cache file under CACHE_DIR."""
+    return os.path.join(CACHE_DIR, name)
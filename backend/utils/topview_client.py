@@ -0,0 +1,279 @@
+import asyncio
+import os
+import random
+import threading
+from typing import Any, Callable, Dict, Optional
+import httpx
+from dotenv import load_dotenv
+from utils import topview_notices
+
+load_dotenv()
+TOPVIEW_BASE = os.getenv("TOPVIEW_BASE", "https://api.topview.ai/v1")
+TOPVIEW_MAX_CONNECTIONS = int(os.getenv("TOPVIEW_MAX_CONNECTIONS", "20"))
+TOPVIEW_CONNECT_TIMEOUT = float(os.getenv("TOPVIEW_CONNECT_TIMEOUT", "10"))
+TOPVIEW_TIMEOUT = float(os.getenv("TOPVIEW_TIMEOUT", "30"))
+# Uploads and result downloads move whole videos; give them a longer read/write window
+TOPVIEW_TRANSFER_TIMEOUT = float(os.getenv("TOPVIEW_TRANSFER_TIMEOUT", "300"))
+TOPVIEW_MAX_RETRIES = int(os.getenv("TOPVIEW_MAX_RETRIES", "3"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class TopviewClient:
+    """
+    Async client for the Topview API with one shared connection pool.
+
+    The httpx.AsyncClient lives on a dedicated event-loop thread so the same
+    keep-alive (HTTP/2 when h2 is installed) connections serve both async
+    routes (await the methods directly) and the worker threads of the batch
+    flow (client.run(coro)). Every call has a timeout; GETs/PUTs and requests
+    that never reached the server are retried with jittered backoff.
+    """
+
+    def __init__(self, base: str = TOPVIEW_BASE, auth: Optional[str] = None, uid: Optional[str] = None,
+                 max_connections: int = TOPVIEW_MAX_CONNECTIONS, max_retries: int = TOPVIEW_MAX_RETRIES):
+        self.base = base.rstrip("/")
+        self.auth = auth if auth is not None else os.getenv("TOPVIEW_AUTH")
+        self.uid = uid if uid is not None else os.getenv("TOPVIEW_UID")
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.http2 = _http2_available()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    # ---- event loop / connection pool ----
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="topview-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _client(self) -> httpx.AsyncClient:
+        # Only ever called on the client loop, so no locking needed
+        if self._http is None:
+            if not self.http2:
+                print("[Topview] h2 not installed, using HTTP/1.1 keep-alive")
+            self._http = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=httpx.Timeout(TOPVIEW_TIMEOUT, connect=TOPVIEW_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._http
+
+    async def _on_loop(self, coro):
+        """Await coro on the client loop, from whichever loop we are on."""
+        loop = self._get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, coro):
+        """Blocking entry point for sync code (worker threads, scripts)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._http is not None:
+            self.run(self._http.aclose())
+            self._http = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    # ---- transport ----
+
+    def headers(self, json: bool = True) -> Dict[str, str]:
+        h = {"Authorization": f"Bearer {self.auth}", "Topview-Uid": self.uid}
+        if json:
+            h["Content-Type"] = "application/json"
+        return h
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            try:
+                return float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(10.0, 0.5 * (2 ** attempt)))
+
+    async def _send(self, method: str, url: str, *, idempotent: bool = True,
+                    content: Optional[Callable[[], Any]] = None, **kwargs) -> httpx.Response:
+        """
+        One request with retries. Non-idempotent calls (task submits) are only
+        retried when the request never got out, so a task is never submitted twice.
+        content is a factory so a streamed body can be replayed on retry.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                if content is not None:
+                    kwargs["content"] = content()
+                response = await self._client().request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                error = e
+                response = None
+            except httpx.TransportError as e:
+                if not idempotent:
+                    raise
+                error = e
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS or (not idempotent and response.status_code != 429):
+                    response.raise_for_status()
+                    return response
+                error = httpx.HTTPStatusError(f"{response.status_code} from {url}",
+                                              request=response.request, response=response)
+            if attempt == self.max_retries:
+                raise error
+            delay = self._backoff(attempt, response)
+            print(f"[Topview] {method} {url} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _api(self, method: str, path: str, *, idempotent: bool = True, **kwargs) -> Any:
+        async def call():
+            response = await self._send(method, f"{self.base}{path}", idempotent=idempotent,
+                                        headers=self.headers(json=method != "GET"), **kwargs)
+            return response.json()
+        return await self._on_loop(call())
+
+    # ---- uploads ----
+
+    async def get_upload_credential(self, file_format: str) -> Dict[str, Any]:
+        data = await self._api("GET", "/upload/credential", params={"format": file_format})
+        return data["result"]
+
+    async def put_file(self, upload_url: str, file_path: str, content_type: str):
+        size = os.path.getsize(file_path)
+
+        async def body():
+            with open(file_path, "rb") as f:
+                while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                    yield chunk
+
+        # Presigned object-store PUTs need Content-Length, not chunked encoding
+        await self._on_loop(self._send(
+            "PUT", upload_url, content=body,
+            headers={"Content-Type": content_type, "Content-Length": str(size)},
+            timeout=httpx.Timeout(TOPVIEW_TRANSFER_TIMEOUT, connect=TOPVIEW_CONNECT_TIMEOUT),
+        ))
+
+    async def check_upload(self, file_id: str, interval: float = 1, max_retries: int = 30) -> bool:
+        for _ in range(max_retries):
+            data = await self._api("GET", "/upload/check", params={"fileId": file_id})
+            if data.get("result") is True:
+                return True
+            await asyncio.sleep(interval)
+        return False
+
+    async def upload(self, file_path: str, file_format: str, content_type: str) -> str:
+        cred = await self.get_upload_credential(file_format)
+        file_id = cred["fileId"]
+        await self.put_file(cred["uploadUrl"], file_path, content_type)
+        if not await self.check_upload(file_id):
+            raise TimeoutError("Upload not confirmed")
+        return file_id
+
+    # ---- tasks ----
+
+    async def submit_voice_clone(self, origin_voice_file_id: str, notice_url: Optional[str] = None) -> str:
+        payload = {"originVoiceFileId": origin_voice_file_id, "voiceSpeed": "0.8"}
+        if notice_url:
+            payload["noticeUrl"] = notice_url
+        data = await self._api("POST", "/voice/clone/task/submit", json=payload, idempotent=False)
+        return data["result"]["taskId"]
+
+    async def get_voice_clone(self, task_id: str) -> Dict[str, Any]:
+        data = await self._api("GET", "/voice/clone/task/query", params={"taskId": task_id})
+        return data.get("result", {})
+
+    async def submit_video_task(self, video_file_id: str, voice_id: str, tts_text: str,
+                                notice_url: Optional[str] = None) -> str:
+        payload = {
+            "avatarSourceFrom": "0",
+            "videoFileId": video_file_id,
+            "audioSourceFrom": "1",
+            "ttsText": tts_text,
+            "voiceoverId": voice_id,
+            "modeType": "0"
+        }
+        if notice_url:
+            payload["noticeUrl"] = notice_url
+        data = await self._api("POST", "/video_avatar/task/submit", json=payload, idempotent=False)
+        return data["result"]["taskId"]
+
+    async def get_video_task(self, task_id: str) -> Dict[str, Any]:
+        data = await self._api("GET", "/video_avatar/task/query",
+                               params={"taskId": task_id, "needCloudFrontUrl": "true"})
+        return data.get("result", {})
+
+    async def poll(self, task_id: str, fetch, interval: float, max_tries: int,
+                   notice: bool = False, fallback_interval: float = 30) -> Dict[str, Any]:
+        """
+        Async twin of Topview._poll_task: await fetch(task_id) until the task
+        succeeds/fails or interval * max_tries seconds pass. With notice=True
+        it sleeps on the /notice/topview callback between slow fallback polls.
+        """
+        waiter = topview_notices.expect(task_id) if notice else None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + interval * max_tries
+        try:
+            while True:
+                result = await fetch(task_id)
+                remaining = deadline - loop.time()
+                if result.get("status") in ("success", "failed") or remaining <= 0:
+                    return result
+                if waiter is not None and not waiter.done():
+                    try:
+                        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)),
+                                               timeout=min(max(interval, fallback_interval), remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(min(interval, remaining))
+        finally:
+            if waiter is not None:
+                topview_notices.discard(task_id)
+
+    # ---- downloads ----
+
+    async def download(self, url: str, local_path: str) -> str:
+        async def fetch():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._client().stream(
+                        "GET", url,
+                        timeout=httpx.Timeout(TOPVIEW_TRANSFER_TIMEOUT, connect=TOPVIEW_CONNECT_TIMEOUT),
+                    ) as resp:
+                        resp.raise_for_status()
+                        with open(local_path, "wb") as f:
+                            async for chunk in resp.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                                f.write(chunk)
+                    return local_path
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    if attempt == self.max_retries or (status is not None and status not in RETRY_STATUS):
+                        raise
+                    delay = self._backoff(attempt)
+                    print(f"[Topview] download {url} failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        return await self._on_loop(fetch())
+
+
+topview_client = TopviewClient()
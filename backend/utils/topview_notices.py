@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+# How long a callback that arrived before anyone waited on it is kept around
+EARLY_NOTICE_TTL = 600
+
+_lock = threading.Lock()
+_waiters: Dict[str, Future] = {}
+_early: Dict[str, tuple] = {}  # task_id -> (received_at, payload)
+
+def _prune_early(now: float):
+    for task_id in [t for t, (ts, _) in _early.items() if now - ts > EARLY_NOTICE_TTL]:
+        del _early[task_id]
+
+def expect(task_id: str) -> Future:
+    """
+    Register interest in a Topview task; the future resolves with the
+    callback payload once /notice/topview hears about it.
+    """
+    with _lock:
+        future = _waiters.get(task_id)
+        if future is None:
+            future = Future()
+            _waiters[task_id] = future
+            early = _early.pop(task_id, None)
+            if early is not None:
+                future.set_result(early[1])
+        return future
+
+def resolve(task_id: str, payload: Dict[str, Any]) -> bool:
+    """Complete the waiter for task_id. Returns False if nobody was waiting yet."""
+    with _lock:
+        future = _waiters.get(task_id)
+        if future is None:
+            now = time.time()
+            _prune_early(now)
+            _early[task_id] = (now, payload)
+            return False
+    if not future.done():
+        future.set_result(payload)
+    return True
+
+def discard(task_id: str):
+    with _lock:
+        _waiters.pop(task_id, None)
+
+def task_id_from_notice(body: Dict[str, Any]) -> Optional[str]:
+    """Callbacks carry taskId either at the top level or inside result/data."""
+    for scope in (body, body.get("result"), body.get("data")):
+        if isinstance(scope, dict) and scope.get("taskId"):
+            return str(scope["taskId"])
+    return None
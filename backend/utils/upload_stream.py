@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import os
+from typing import Any, Dict, List
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Bytes buffered in memory before a resumable chunk is sent (multiple of 256 KiB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Upper bound for a single uploaded file
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+class _FilePart:
+    """Headers of the multipart part currently being parsed."""
+
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.field = b""
+        self.value = b""
+
+async def stream_to_gcs(request: Request, gcs, prefix: str, field: str = "file",
+                        expiration: int = 3600) -> Dict[str, Any]:
+    """
+    Pipe the `field` file of a multipart request straight into a GCS
+    resumable upload at <prefix>/<filename>.
+
+    The body is parsed as it arrives; each request chunk is hashed and handed
+    to the blob writer (in a worker thread) before the next one is read, so
+    memory stays around UPLOAD_CHUNK_SIZE and nothing is written to local disk.
+    The object is only committed once the whole file has arrived; on any
+    failure the resumable session is cancelled and the bucket is untouched.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    part = _FilePart()
+    # target: (blob name, content type) of the file we are storing
+    state = {"target": None, "active": False, "writer": None}
+    pending: List[bytes] = []
+    sha256 = hashlib.sha256()
+    size = 0
+
+    def on_part_begin():
+        nonlocal part
+        part = _FilePart()
+
+    def on_header_field(data, start, end):
+        if part.value:
+            part.headers[part.field.lower()] = part.value
+            part.field, part.value = b"", b""
+        part.field += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.value += data[start:end]
+
+    def on_headers_finished():
+        if part.field:
+            part.headers[part.field.lower()] = part.value
+        _, disposition = parse_options_header(part.headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = os.path.basename(disposition.get(b"filename", b"").decode("utf-8", "replace"))
+        # Only the first file in `field` is stored; other parts are skipped
+        if name == field and filename and state["target"] is None:
+            content_type = part.headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+            state["target"] = (f"{prefix}/{filename}", content_type)
+            state["active"] = True
+
+    def on_part_data(data, start, end):
+        if state["active"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        state["active"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["target"] is not None and state["writer"] is None:
+                state["writer"] = await asyncio.to_thread(gcs.open_writer, *state["target"], UPLOAD_CHUNK_SIZE)
+            if pending and state["writer"] is not None:
+                data = b"".join(pending)
+                pending.clear()
+                size += len(data)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                sha256.update(data)
+                await asyncio.to_thread(state["writer"].write, data)
+        parser.finalize()
+
+        if state["writer"] is None:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        # close() sends the final chunk and commits the object
+        await asyncio.to_thread(state["writer"].close)
+    except BaseException:
+        # 413, client disconnect, bad multipart...: cancel the session so nothing is committed
+        if state["writer"] is not None:
+            await asyncio.shield(asyncio.to_thread(state["writer"].abort))
+        raise
+    blob = state["target"][0]
+    print(f"✅ 文件流式上传成功: {blob} ({size} bytes)")
+
+    url = gcs.generate_signed_url(blob, expiration=expiration, check_exists=False)
+    return {"blob": blob, "url": url, "size": size, "sha256": sha256.hexdigest()}
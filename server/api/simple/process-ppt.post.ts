@@ -1,6 +1,6 @@
 export default defineEventHandler(async (event) => {
   const body = await readBody(event)
-  const { ppt_blob, ppt_url } = body
+  const { ppt_blob, ppt_url, image_mode } = body
 
   if (!ppt_blob) {
     throw createError({
@@ -16,7 +16,8 @@ export default defineEventHandler(async (event) => {
       method: "POST",
       body: { 
         ppt_blob,
-        ppt_url 
+        ppt_url,
+        image_mode
       }
     })
 